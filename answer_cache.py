@@ -0,0 +1,92 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL", "3600"))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "512"))
+
+CONTRACTIONS = {
+    "what's": "what is",
+    "how's": "how is",
+    "where's": "where is",
+    "who's": "who is",
+    "i'm": "i am",
+    "don't": "do not",
+    "doesn't": "does not",
+    "isn't": "is not",
+    "can't": "cannot",
+}
+CONTRACTION_PATTERN = re.compile(r"\b(" + "|".join(re.escape(c) for c in CONTRACTIONS) + r")\b")
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s&$%]+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    """Fold case, contractions, punctuation and spacing so equivalent questions share a key"""
+    text = question.lower().replace("’", "'")
+    text = CONTRACTION_PATTERN.sub(lambda m: CONTRACTIONS[m.group(1)], text)
+    text = PUNCTUATION_PATTERN.sub(" ", text)
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+class AnswerCache:
+    """Thread-safe LRU cache of model answers with a time-to-live"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(doc_hash, question, glossary_version, model_name):
+        return (doc_hash, normalize_question(question), glossary_version or "", model_name)
+
+    def get(self, key):
+        """Return the cached answer for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, answer):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+_default_cache = None
+
+
+def get_answer_cache():
+    """Process-wide cache, so users looking at the same document share answers"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = AnswerCache()
+    return _default_cache
@@ -0,0 +1,318 @@
+"""Headless RCV/ACV/depreciation extraction over a folder of claim PDFs
+
+    python batch_extract.py CLAIMS_DIR --output results.jsonl
+    python batch_extract.py CLAIMS_DIR --output results.csv --workers 4
+    python batch_extract.py CLAIMS_DIR --output results.jsonl --dry-run
+
+Figures come from the local extractor; the model is only asked about claims
+where RCV, ACV or depreciation were not found. Results are appended as each
+file finishes, and finished files are listed in a checkpoint next to the
+output, so re-running the same command resumes after a crash. Files whose
+result row was written but not yet checkpointed are not processed again.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import claim_extractor
+import fake_gemini
+import functions
+import gemini_client
+import model_registry
+import parallel_extract
+import text_cache
+
+FIELDS = [field for field, _ in claim_extractor.FIELD_LABELS]
+CSV_COLUMNS = ["path", "status", "source", "pages_scanned", "doc_hash"] + \
+    [column for field in FIELDS for column in (field, f"{field}_page")] + ["seconds", "error"]
+
+EXTRACTION_QUESTION = (
+    "What are the RCV (Replacement Cost Value), ACV (Actual Cash Value) and depreciation amounts in this claim? "
+    "Reply with exactly three lines: \"RCV: $amount\", \"ACV: $amount\" and \"Depreciation: $amount\", "
+    "writing \"not found\" instead of an amount that is not in the document."
+)
+DRY_RUN_KEY = "dry-run"
+
+# Set per worker process by _init_worker
+_api_key = None
+_model_config = None
+
+
+def dry_run_answer(prompt):
+    """Stub model reply: whatever figures the local extractor sees in the prompt's excerpts"""
+    amounts = claim_extractor.extract_claim_amounts([prompt.split("Question:")[0]])
+    lines = []
+    for field, label in (("rcv", "RCV"), ("acv", "ACV"), ("depreciation", "Depreciation")):
+        found = amounts.get(field)
+        lines.append(f"{label}: {claim_extractor.format_amount(found.amount) if found else 'not found'}")
+    return "\n".join(lines)
+
+
+def _init_worker(api_key, model_config, dry_run, fake_latency, nested_pool):
+    global _api_key, _model_config
+    _api_key = api_key
+    _model_config = model_config
+    if not nested_pool:
+        # The batch pool already keeps every CPU busy; do not fork another pool per large PDF
+        parallel_extract.DEFAULT_WORKERS = 1
+    if dry_run:
+        model = fake_gemini.FakeGenerativeModel(latency=fake_latency, responder=dry_run_answer)
+        model_registry.install_client(api_key, gemini_client.GeminiClient(model), model_config)
+
+
+def process_claim(root, rel_path):
+    """Extract one claim; never raises, failures come back as status "error" records"""
+    started = time.perf_counter()
+    record = {"path": rel_path, "status": "ok", "source": "document", "pages_scanned": 0, "doc_hash": None}
+    try:
+        data = functions.read_pdf_bytes(os.path.join(root, rel_path))
+        record["doc_hash"] = text_cache.content_hash(data)
+        amounts, record["pages_scanned"] = functions.scan_pdf_amounts(data)
+
+        missing = [field for field in claim_extractor.PRIMARY_FIELDS if field not in amounts]
+        if missing and _api_key:
+            # Same path as the app: shared client, prompt budget and answer cache
+            rag = functions.process_pdf_from_file(data, _api_key, _model_config)
+            result = rag.invoke({"input": EXTRACTION_QUESTION})
+            if result.get("error"):
+                raise RuntimeError(result["answer"])
+            scanner = claim_extractor.ClaimAmountScanner()
+            # Page 0 marks figures that came from the model rather than a document page
+            scanner.feed(0, result["answer"])
+            for field, found in scanner.results().items():
+                if field in missing:
+                    amounts[field] = found
+            record["source"] = "model"
+        elif missing and not amounts:
+            record["source"] = "none"
+
+        for field in FIELDS:
+            found = amounts.get(field)
+            record[field] = str(found.amount) if found else None
+            record[f"{field}_page"] = found.page if found else None
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {str(e)}"
+    record["seconds"] = round(time.perf_counter() - started, 4)
+    return record
+
+
+def find_pdfs(root):
+    """Relative paths of every PDF under root, in a stable order"""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(".pdf"):
+                paths.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return paths
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as file:
+        return {line.rstrip("\n") for line in file if line.strip()}
+
+
+def load_written(path, output_format):
+    """Paths whose finished result is already in the output, e.g. written just before a crash
+
+    A row is written before its checkpoint line, so these are the files the
+    checkpoint may be missing; a half-written last row does not count.
+    """
+    if not os.path.exists(path):
+        return set()
+    written = set()
+    with open(path, encoding="utf-8", newline="") as file:
+        if output_format == "csv":
+            for row in csv.DictReader(file):
+                # Missing trailing columns come back as None
+                if row.get("status") == "ok" and row.get("error") is not None:
+                    written.add(row["path"])
+        else:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and record.get("status") == "ok":
+                    written.add(record["path"])
+    return written
+
+
+def drop_partial_row(path, block_size=65536):
+    """Cut a half-written last row off the output, so the next row starts on a line of its own"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as file:
+        end = position = file.seek(0, os.SEEK_END)
+        keep = 0
+        # Search backwards for the last newline without reading the whole file
+        while position > 0:
+            start = max(0, position - block_size)
+            file.seek(start)
+            newline = file.read(position - start).rfind(b"\n")
+            if newline != -1:
+                keep = start + newline + 1
+                break
+            position = start
+        if keep < end:
+            file.truncate(keep)
+            print(f"[DEBUG] Dropped a half-written last row ({end - keep} bytes) from {path}")
+
+
+class ResultWriter:
+    """Appends records as JSON lines or CSV rows, flushing each one so a crash loses nothing written
+
+    A row cut short by a crash is dropped before appending.
+    """
+
+    def __init__(self, path, output_format):
+        self.output_format = output_format
+        drop_partial_row(path)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", encoding="utf-8", newline="")
+        if output_format == "csv":
+            self.writer = csv.DictWriter(self.file, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+            if new_file:
+                self.writer.writeheader()
+
+    def write(self, record):
+        if self.output_format == "csv":
+            self.writer.writerow(record)
+        else:
+            self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+def summarize(records, skipped, elapsed):
+    errors = sum(1 for record in records if record["status"] == "error")
+    pages = sum(record["pages_scanned"] for record in records)
+    seconds = [record["seconds"] for record in records]
+    return {
+        "files": len(records),
+        "skipped_from_checkpoint": skipped,
+        "errors": errors,
+        "error_rate": (errors / len(records)) if records else 0.0,
+        "model_fallbacks": sum(1 for record in records if record["source"] == "model"),
+        "pages_scanned": pages,
+        "elapsed_seconds": round(elapsed, 3),
+        "files_per_second": round(len(records) / elapsed, 3) if elapsed else 0.0,
+        "pages_per_second": round(pages / elapsed, 3) if elapsed else 0.0,
+        "p50_file_seconds": percentile(seconds, 0.5),
+        "p95_file_seconds": percentile(seconds, 0.95),
+    }
+
+
+def run_batch(root, output, output_format=None, workers=None, checkpoint=None, use_model=True,
+              dry_run=False, fake_latency=0.0):
+    """Process every PDF under root that is not in the checkpoint; returns the summary dict"""
+    output_format = output_format or ("csv" if output.lower().endswith(".csv") else "jsonl")
+    checkpoint = checkpoint or output + ".checkpoint"
+    workers = workers or (os.cpu_count() or 1)
+
+    api_key = None
+    if dry_run:
+        api_key = DRY_RUN_KEY
+    elif use_model:
+        api_key = os.environ.get("GEMINI_API")
+        if not api_key:
+            print("[DEBUG] GEMINI_API not set, extracting with the local extractor only")
+    model_config = model_registry.load_model_config()
+
+    # Opened first so a half-written last row is gone before the output is read back
+    writer = ResultWriter(output, output_format)
+    done = load_checkpoint(checkpoint)
+    # A crash between writing a row and checkpointing it must not write the row twice
+    done |= load_written(output, output_format)
+    pending = [path for path in find_pdfs(root) if path not in done]
+    print(f"[DEBUG] {len(pending)} claims to process, {len(done)} already in checkpoint")
+
+    init_args = (api_key, model_config, dry_run, fake_latency, workers <= 1)
+    records = []
+    started = time.perf_counter()
+    try:
+        with open(checkpoint, "a", encoding="utf-8") as checkpoint_file:
+            def finish(record):
+                writer.write(record)
+                # Failed files stay out of the checkpoint so the next run retries them
+                if record["status"] == "ok":
+                    checkpoint_file.write(record["path"] + "\n")
+                    checkpoint_file.flush()
+                records.append(record)
+                if record["status"] == "error":
+                    print(f"[ERROR] {record['path']}: {record['error']}")
+
+            if workers <= 1:
+                _init_worker(*init_args)
+                for path in pending:
+                    finish(process_claim(root, path))
+            else:
+                context = multiprocessing.get_context(parallel_extract.START_METHOD)
+                with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                         initargs=init_args) as pool:
+                    # A bounded window keeps memory flat over thousands of files
+                    queue = iter(pending)
+                    in_flight = set()
+                    while True:
+                        for path in queue:
+                            in_flight.add(pool.submit(process_claim, root, path))
+                            if len(in_flight) >= workers * 4:
+                                break
+                        if not in_flight:
+                            break
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            finish(future.result())
+    finally:
+        writer.close()
+
+    summary = summarize(records, len(done), time.perf_counter() - started)
+    print(f"[SUCCESS] Processed {summary['files']} claims in {summary['elapsed_seconds']}s "
+          f"({summary['files_per_second']} files/s, error rate {summary['error_rate']:.1%})")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract RCV, ACV and depreciation from a folder of claim PDFs")
+    parser.add_argument("claims_dir", help="directory searched recursively for PDFs")
+    parser.add_argument("--output", required=True, help="results file, appended to (.jsonl or .csv)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="output format (default: from the extension)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: number of CPUs)")
+    parser.add_argument("--checkpoint", help="list of finished files (default: OUTPUT.checkpoint)")
+    parser.add_argument("--no-model", action="store_true", help="never call the model, local extraction only")
+    parser.add_argument("--dry-run", action="store_true", help="use a stubbed local model instead of Gemini")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="seconds per stubbed model call")
+    parser.add_argument("--summary", help="also write the run summary to this JSON file")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.claims_dir):
+        parser.error(f"not a directory: {args.claims_dir}")
+
+    summary = run_batch(args.claims_dir, args.output, args.format, args.workers, args.checkpoint,
+                        use_model=not args.no_model, dry_run=args.dry_run, fake_latency=args.fake_latency)
+    print(json.dumps(summary, indent=2))
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""Benchmarks for extraction, prompt building and end-to-end question latency
+
+    python benchmark.py --output bench_before.json
+    python benchmark.py --output bench_after.json --compare bench_before.json
+    python benchmark.py --check
+
+Synthetic claim PDFs of 1/10/100/500 pages (the summary totals sit on the
+last page) and insurance_glossary.pdf are timed stage by stage. Model calls
+go to fake_gemini with a fixed latency, so numbers are comparable across
+commits. Results are written as JSON with p50/p95 and the traced Python
+allocation peak per stage, the peak RSS of the whole run and prompt token
+sizes. check_prefix_cache runs first and fails the run when a
+claim's prompt prefix is resent, sent uncached once refused, or kept after
+its chain is closed.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Benchmarks start from a cold, private text cache, removed again when the process exits
+if "PDF_TEXT_CACHE_DIR" not in os.environ:
+    _text_cache_dir = tempfile.TemporaryDirectory(prefix="pdf_bench_cache_")
+    os.environ["PDF_TEXT_CACHE_DIR"] = _text_cache_dir.name
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import answer_cache
+import fake_gemini
+import functions
+import gemini_client
+import glossary
+import model_registry
+import parallel_extract
+import prompt_cache
+import text_cache
+import text_normalize
+import token_count
+
+DEFAULT_SIZES = (1, 10, 100, 500)
+GLOSSARY_PATH = "insurance_glossary.pdf"
+BENCH_KEY = "benchmark"
+QUESTIONS = [
+    "What is my ACV amount and what does ACV mean in insurance terms?",
+    "What is my RCV amount and what does RCV mean in insurance terms?",
+    "What is the depreciation amount and what does depreciation mean in insurance?",
+    "What is my deductible amount and what does deductible mean in insurance?",
+]
+
+
+def make_pdf(pages_lines):
+    """Minimal uncompressed PDF with one Helvetica text line per entry"""
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    # Page objects point at the page tree, which is written after all pages
+    pages_id = len(objects) + 2 * len(pages_lines) + 1
+    page_ids = []
+    for lines in pages_lines:
+        ops = ["BT /F1 9 Tf"]
+        for row, line in enumerate(lines):
+            text = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            ops.append(f"1 0 0 1 40 {760 - 12 * row} Tm ({text}) Tj")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        contents = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, contents, font)
+        ))
+    add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % i for i in page_ids), len(page_ids)))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+def synthetic_claim_pdf(page_count, claim_number=None):
+    """Estimate with page_count - 1 pages of line items followed by a summary page
+
+    A claim_number is printed on the summary page, so each number gives a distinct PDF.
+    """
+    pages = []
+    for page in range(1, page_count):
+        lines = [f"Estimate detail page {page} - Kitchen"]
+        for item in range(1, 41):
+            lines.append(f"{item}. Remove and replace 1/2\" drywall {page}-{item} 12.00 SF 3.25 39.00 (5.00) 34.00")
+        pages.append(lines)
+    pages.append([f"Claim number {claim_number}"] if claim_number is not None else [])
+    pages[-1].extend([
+        "Summary for Dwelling", "Line Item Total 28,415.22", "Replacement Cost Value $31,230.50",
+        "Less Depreciation (6,120.75)", "Actual Cash Value $25,109.75", "Less Deductible (1,000.00)",
+        "Net Claim $24,109.75", "Total Recoverable Depreciation 6,120.75",
+    ])
+    return make_pdf(pages)
+
+
+def peak_rss_mb():
+    """Highest resident memory of the process so far; it never goes down, so it says nothing about one stage"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def measure(fn, repeat, setup=None):
+    """Time fn over repeat runs plus one untimed traced run; returns stats and fn's last result"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, traced_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    stats = {
+        "runs": repeat,
+        "p50_ms": round(statistics.median(timings) * 1000, 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))] * 1000, 3),
+        "mean_ms": round(statistics.fmean(timings) * 1000, 3),
+        "min_ms": round(timings[0] * 1000, 3),
+        "py_peak_mb": round(traced_peak / (1024 * 1024), 2),
+    }
+    return stats, result
+
+
+def bench_glossary(repeat):
+    results = {}
+    if not os.path.exists(GLOSSARY_PATH):
+        print(f"[DEBUG] {GLOSSARY_PATH} not found, skipping glossary benchmarks")
+        return results, None
+    results["extract_glossary_text"], glossary_text = measure(
+        lambda: functions.extract_glossary_text(GLOSSARY_PATH), repeat)
+    results["parse_glossary"], glossary_index = measure(
+        lambda: glossary.GlossaryIndex.from_text(glossary_text), repeat)
+    return results, glossary_index
+
+
+def bench_claim(page_count, repeat, glossary_index):
+    data = synthetic_claim_pdf(page_count)
+    results = {"pdf_bytes": len(data)}
+
+    results["pdf_to_text"], raw_pages = measure(lambda: list(parallel_extract.iter_page_texts(data)), repeat)
+    results["clean_text"], _ = measure(lambda: [text_normalize.normalize_pdf_text(page) for page in raw_pages], repeat)
+    results["index_cold"], _ = measure(lambda: functions.build_document_index(data), repeat,
+                                       setup=text_cache.get_text_cache().clear)
+    results["index_warm"], _ = measure(lambda: functions.build_document_index(data), repeat)
+    results["scan_amounts"], _ = measure(lambda: functions.scan_pdf_amounts(data), repeat)
+
+    if glossary_index is not None:
+        build = lambda: functions.create_expert_claim_system(data, glossary_index, BENCH_KEY)
+    else:
+        build = lambda: functions.process_pdf_from_file(data, BENCH_KEY)
+    results["system_setup"], rag = measure(build, repeat)
+
+    results["prompt_build"], _ = measure(lambda: [rag.prompt({"input": q}) for q in QUESTIONS], repeat)
+    prompt_tokens = [token_count.count_tokens(rag.prompt({"input": q})) for q in QUESTIONS]
+    results["prompt_tokens"] = {
+        "min": min(prompt_tokens),
+        "max": max(prompt_tokens),
+        "mean": round(statistics.fmean(prompt_tokens), 1),
+        "exact": token_count.get_encoding() is not None,
+    }
+
+    cache = answer_cache.get_answer_cache()
+    results["invoke"], _ = measure(lambda: rag.invoke({"input": QUESTIONS[0]}), repeat, setup=cache.clear)
+    results["invoke_cached"], _ = measure(lambda: rag.invoke({"input": QUESTIONS[0]}), repeat)
+    return results
+
+
+def expect(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def check_prefix_cache(glossary_index, pages=10, failed_pages=60):
+    """Verify on the fake backend that a claim's prefix is uploaded once and questions send only their suffix
+
+    A backend that refuses the upload must leave questions on retrieval
+    prompts within PROMPT_TOKEN_LIMIT rather than sending the whole claim,
+    and closing the chain must delete its upload.
+    """
+    results = {}
+    for name, page_count, refuse in (("cached", pages, False), ("refused", failed_pages, True)):
+        model = fake_gemini.FakeGenerativeModel()
+
+        def refused(text, ttl):
+            raise fake_gemini.FakeAPIError(400, "Explicit caching is not available")
+
+        key = f"{BENCH_KEY}-prefix-{name}"
+        prefix_cache = prompt_cache.PrefixCache(refused if refuse else model.cache_prefix, delete=model.delete_prefix)
+        model_registry.install_client(key, gemini_client.GeminiClient(model, prefix_cache=prefix_cache))
+        data = synthetic_claim_pdf(page_count)
+        if glossary_index is not None:
+            rag = functions.create_expert_claim_system(data, glossary_index, key)
+        else:
+            rag = functions.process_pdf_from_file(data, key)
+        expect(rag.prefix is not None, f"{name}: no prompt prefix was built")
+        # The upload runs in the background; wait for it so both questions see the same state
+        bound = prefix_cache.model_for(rag.prefix, timeout=10)
+        answer_cache.get_answer_cache().clear()
+        answers = [rag.invoke({"input": question}) for question in QUESTIONS[:2]]
+        expect(not any(answer.get("error") for answer in answers), f"{name}: a question failed: {answers}")
+        call_tokens = [token_count.count_tokens(call) for call in model.calls]
+        rag.close()
+        results[name] = {"pages": page_count, "prefix_uploads": len(model.cached_prefixes),
+                         "prefix_deletes": len(model.deleted_prefixes), "calls": len(model.calls),
+                         "max_call_tokens": max(call_tokens)}
+
+        expect(len(model.calls) == 2, f"{name}: expected 2 model calls, got {len(model.calls)}")
+        if refuse:
+            expect(bound is None, "refused: the prefix was kept after the backend refused it")
+            expect(max(call_tokens) <= functions.PROMPT_TOKEN_LIMIT,
+                   f"refused: a call sent {max(call_tokens)} tokens, over PROMPT_TOKEN_LIMIT")
+        else:
+            expect(bound is not None, "cached: the claim was not cached")
+            expect(len(model.cached_prefixes) == 1, f"cached: prefix uploaded {len(model.cached_prefixes)} times")
+            expect(model.deleted_prefixes == model.cached_prefixes, "cached: closing the chain kept the upload")
+            expect(not any(rag.prefix.text in call for call in model.calls), "cached: a call resent the prefix")
+            expect(max(call_tokens) < rag.prefix.tokens, "cached: a call was not suffix-only")
+        print(f"[SUCCESS] Prefix check ({name}): {results[name]}")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=DEFAULT_SIZES, repeat=5, latency=0.05):
+    model_registry.install_client(
+        BENCH_KEY, gemini_client.GeminiClient(fake_gemini.FakeGenerativeModel(latency=latency)))
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": repeat,
+            "fake_latency_s": latency,
+            "tokenizer_exact": token_count.get_encoding() is not None,
+        },
+        "glossary": {},
+        "claims": {},
+    }
+    report["glossary"], glossary_index = bench_glossary(repeat)
+    report["prefix_cache"] = check_prefix_cache(glossary_index)
+    for page_count in sizes:
+        print(f"[DEBUG] Benchmarking {page_count}-page claim")
+        report["claims"][str(page_count)] = bench_claim(page_count, repeat, glossary_index)
+    # Stages are compared by py_peak_mb; RSS is only meaningful for the run as a whole
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def compare(report, baseline):
+    """Print p50 changes against an earlier report; positive percentages are slower"""
+    rows = []
+    sections = [("glossary", report["glossary"], baseline.get("glossary", {}))]
+    for size, stages in report["claims"].items():
+        sections.append((f"{size} pages", stages, baseline.get("claims", {}).get(size, {})))
+    for name, stages, old_stages in sections:
+        for stage, stats in stages.items():
+            old = old_stages.get(stage)
+            if not isinstance(stats, dict) or "p50_ms" not in stats or not old or not old.get("p50_ms"):
+                continue
+            change = (stats["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+            rows.append(f"{name:>10} {stage:<22} {old['p50_ms']:>10.2f} -> {stats['p50_ms']:>10.2f} ms  {change:+7.1f}%")
+    print(f"Compared with {baseline['meta'].get('commit')}:")
+    print("\n".join(rows))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PDF extraction, prompt building and question latency")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="claim page counts, comma separated")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per stage")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per fake model call")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON report")
+    parser.add_argument("--compare", help="earlier JSON report to compare p50 timings against")
+    parser.add_argument("--check", action="store_true", help="only run the prefix cache checks on the fake backend")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        glossary_index = functions.load_glossary_index(GLOSSARY_PATH) if os.path.exists(GLOSSARY_PATH) else None
+        check_prefix_cache(glossary_index)
+        return
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    report = run(sizes, args.repeat, args.latency)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"[SUCCESS] Benchmark results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(report, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
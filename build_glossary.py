@@ -0,0 +1,29 @@
+"""Compile the glossary PDF into the artifact the app memory-maps at startup
+
+    python build_glossary.py [insurance_glossary.pdf]
+
+Run it after changing the glossary PDF and commit the .glossary file written
+next to it. The app recompiles by itself when the PDF no longer matches the
+artifact's hash, but that happens in the background after the first render.
+"""
+import argparse
+import sys
+
+import functions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the insurance glossary PDF")
+    parser.add_argument("glossary_pdf", nargs="?", default="insurance_glossary.pdf", help="glossary PDF to compile")
+    args = parser.parse_args(argv)
+
+    index = functions.compile_glossary(args.glossary_pdf)
+    if index is None:
+        print(f"[ERROR] Could not compile {args.glossary_pdf}")
+        return 1
+    print(f"[SUCCESS] Wrote {functions.glossary_artifact_path(args.glossary_pdf)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import os
+import re
+from collections import namedtuple
+
+import text_normalize
+import token_count
+
+# Recent turns are sent word for word up to this many tokens; older turns are folded into the digest
+CHAT_HISTORY_TOKENS = int(os.environ.get("CHAT_HISTORY_TOKENS", "600"))
+# The digest keeps its newest lines within this many tokens
+CHAT_DIGEST_TOKENS = int(os.environ.get("CHAT_DIGEST_TOKENS", "250"))
+# Longest piece of an answer kept in its digest line
+DIGEST_ANSWER_CHARS = 160
+
+Turn = namedtuple("Turn", ["question", "answer", "tokens"])
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+DOLLAR_AMOUNT = re.compile(r"\$\s?\d[\d,]*(?:\.\d{2})?")
+
+
+def format_turn(question, answer):
+    return f"User: {question}\nAssistant: {answer}"
+
+
+def shorten_answer(question, answer, tokens):
+    """answer cut at a word so its turn fits in tokens"""
+    words = answer.split(" ")
+
+    def cut(count):
+        return " ".join(words[:count]) + " ..."
+
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if token_count.count_tokens(format_turn(question, cut(middle))) <= tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return cut(low)
+
+
+def digest_line(question, answer):
+    """One line for a folded turn: the question, the answer's first sentence and the dollar figures it gave"""
+    first = SENTENCE_END.split(answer, 1)[0][:DIGEST_ANSWER_CHARS]
+    amounts = [amount for amount in dict.fromkeys(DOLLAR_AMOUNT.findall(answer)) if amount not in first]
+    line = f"- {question} -> {first}"
+    if amounts:
+        line += f" (figures: {', '.join(amounts)})"
+    return line
+
+
+class ChatSession:
+    """One conversation about the selected documents
+
+    request() turns a question into the input dict for a RAG chain's invoke
+    or invoke_stream, carrying the conversation so far; record() adds the
+    answer once it is complete. The last turns are sent verbatim within
+    history_tokens (the newest always, cut short if it alone is over) and
+    older ones become single digest lines, so every
+    question costs a bounded amount of history however long the chat runs.
+    The digest is built locally without a model call.
+    """
+
+    def __init__(self, history_tokens=CHAT_HISTORY_TOKENS, digest_tokens=CHAT_DIGEST_TOKENS):
+        self.history_tokens = history_tokens
+        self.digest_tokens = digest_tokens
+        self.doc_hash = None
+        self.reset()
+
+    def reset(self):
+        self.turns = []
+        self.digest = []
+        # Turns answered so far, including those summarized or dropped from the digest
+        self.turn_count = 0
+        self.last_question = None
+
+    def bind(self, doc_hash):
+        """Start over when the questions move to a different document selection"""
+        if doc_hash != self.doc_hash:
+            self.reset()
+            self.doc_hash = doc_hash
+
+    def history(self):
+        """Conversation text sent ahead of the next question, "" before the first answer"""
+        parts = []
+        if self.digest:
+            parts.append("Earlier questions (summarized):\n" + "\n".join(self.digest))
+        parts.extend(format_turn(turn.question, turn.answer) for turn in self.turns)
+        return "\n\n".join(parts)
+
+    def request(self, question):
+        """Input dict for the chain: the question, the history and what to search the documents for"""
+        request = {"input": question}
+        if self.turns or self.digest:
+            request["history"] = self.history()
+        if self.last_question:
+            # Follow-ups like "how much of that is recoverable?" need the last question to find their pages
+            request["search"] = f"{self.last_question} {question}"
+        return request
+
+    def record(self, question, answer):
+        # Markdown and line breaks cost tokens on every later question and carry no meaning here
+        answer = text_normalize.normalize_answer(answer)
+        self.turns.append(Turn(question, answer, token_count.count_tokens(format_turn(question, answer))))
+        self.turn_count += 1
+        self.last_question = question
+        self._compact()
+
+    def _compact(self):
+        while len(self.turns) > 1 and sum(turn.tokens for turn in self.turns) > self.history_tokens:
+            turn = self.turns.pop(0)
+            self.digest.append(digest_line(turn.question, turn.answer))
+        # The last exchange is what a follow-up refers to, so a long one is shortened rather than folded
+        newest = self.turns[-1] if self.turns else None
+        if newest is not None and newest.tokens > self.history_tokens:
+            answer = shorten_answer(newest.question, newest.answer, self.history_tokens)
+            self.turns[-1] = Turn(newest.question, answer,
+                                  token_count.count_tokens(format_turn(newest.question, answer)))
+        while len(self.digest) > 1 and token_count.count_tokens("\n".join(self.digest)) > self.digest_tokens:
+            self.digest.pop(0)
+
+    def history_token_count(self):
+        return token_count.count_tokens(self.history()) if self.turns or self.digest else 0
@@ -0,0 +1,86 @@
+import re
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+# One extracted figure together with where it was found (1-based page, character offset in that page)
+ExtractedAmount = namedtuple("ExtractedAmount", ["field", "amount", "page", "offset", "text"])
+
+# Order matters: more specific labels are tried first at each position
+FIELD_LABELS = [
+    ("recoverable_depreciation", r"total\s+recoverable\s+depreciation"),
+    ("non_recoverable_depreciation", r"(?:less\s+)?(?:total\s+)?non[-\s]?recoverable\s+depreciation"),
+    ("rcv", r"(?:total\s+)?(?:replacement\s+cost(?:\s+value)?|rcv)(?:\s+total)?"),
+    ("acv", r"(?:total\s+)?(?:actual\s+cash\s+value|acv)(?:\s+total)?"),
+    ("depreciation", r"(?:less\s+)?(?:total\s+)?(?:recoverable\s+)?(?:depreciation|deprec\.?)(?:\s+total)?"),
+    ("deductible", r"(?:less\s+)?(?:total\s+)?deductible"),
+    ("net_claim", r"net\s+(?:claim|payment)(?:\s+amount)?"),
+]
+
+# Amounts need a $, thousands separators or cents so years and quantities are not mistaken for money
+AMOUNT = r"""(?P<amount>
+    [(<]?\s*-?\s*
+    (?:\$\s*\d[\d,]*(?:\.\d{2})?|\d{1,3}(?:,\d{3})+(?:\.\d{2})?|\d+\.\d{2})
+    \s*[)>]?
+)(?!\s*%)(?![\d.,]*\d)"""
+
+AMOUNT_PATTERN = re.compile(
+    r"(?<![\w])(?:" + "|".join(f"(?P<{field}>{label})" for field, label in FIELD_LABELS) + r")"
+    r"\b[\s:=\-–]*" + AMOUNT,
+    re.IGNORECASE | re.VERBOSE,
+)
+
+PRIMARY_FIELDS = ("rcv", "acv", "depreciation")
+
+
+def parse_amount(text):
+    """Turn "$1,234.50", "(6,120.75)" or "<10.00>" into a positive Decimal"""
+    digits = re.sub(r"[^\d.]", "", text)
+    try:
+        return Decimal(digits)
+    except InvalidOperation:
+        return None
+
+
+class ClaimAmountScanner:
+    """Collects labelled amounts page by page so pages can be fed as they are extracted"""
+
+    def __init__(self):
+        self.matches = {}
+        # First page that carries all primary totals, i.e. the estimate summary
+        self.summary_page = None
+
+    def feed(self, page_num, text):
+        fields_on_page = set()
+        for match in AMOUNT_PATTERN.finditer(text):
+            field = next(name for name, _ in FIELD_LABELS if match.group(name))
+            amount = parse_amount(match.group("amount"))
+            if amount is None:
+                continue
+            label = match.group(field)
+            found = ExtractedAmount(field, amount, page_num, match.start(), match.group(0).strip())
+            # Summary totals win over line-level mentions; otherwise the latest mention wins
+            rank = ("total" in label.lower(), page_num, match.start())
+            current = self.matches.get(field)
+            if current is None or rank >= current[0]:
+                self.matches[field] = (rank, found)
+            fields_on_page.add(field)
+        if self.summary_page is None and fields_on_page.issuperset(PRIMARY_FIELDS):
+            self.summary_page = page_num
+
+    def has_primary_fields(self):
+        return all(field in self.matches for field in PRIMARY_FIELDS)
+
+    def results(self):
+        return {field: found for field, (_, found) in self.matches.items()}
+
+
+def extract_claim_amounts(pages):
+    """Scan cleaned page texts for RCV/ACV/depreciation/deductible amounts"""
+    scanner = ClaimAmountScanner()
+    for page_num, text in enumerate(pages, start=1):
+        scanner.feed(page_num, text)
+    return scanner.results()
+
+
+def format_amount(amount):
+    return f"${amount:,.2f}"
@@ -0,0 +1,260 @@
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+
+# Per-session limits; the least recently used document is dropped first
+MAX_DOCUMENTS = int(os.environ.get("SESSION_MAX_DOCUMENTS", "5"))
+MAX_BYTES = int(float(os.environ.get("SESSION_MAX_DOCUMENT_MB", "150")) * 1024 * 1024)
+# Process-wide registry: documents no session holds are kept this long, and dropped sooner past the memory cap
+SHARED_IDLE_SECONDS = float(os.environ.get("SHARED_DOCUMENT_IDLE_SECONDS", "900"))
+SHARED_MAX_BYTES = int(float(os.environ.get("SHARED_DOCUMENT_MAX_MB", "500")) * 1024 * 1024)
+# Measured BM25 index overhead: one (chunk, count) posting, one term (dict slot, two arrays, idf entry)
+# and one chunk (tuple, list slot, length normalisation)
+POSTING_BYTES = 8
+TERM_BYTES = 360
+CHUNK_BYTES = 96
+
+# One uploaded PDF, indexed once: raw bytes for the viewer plus pages, BM25 index and amounts
+IndexedDocument = namedtuple("IndexedDocument", ["name", "doc_hash", "data", "pages", "index", "amounts"])
+
+
+def estimate_bytes(document):
+    """Approximate resident size: PDF bytes, page and chunk text, and the BM25 index"""
+    index = document.index
+    text = sum(len(page) for page in document.pages) + sum(len(chunk.text) for chunk in index.chunks)
+    postings = sum(len(numbers) for numbers, _ in index.postings.values())
+    return (len(document.data) + text + postings * POSTING_BYTES + len(index.postings) * TERM_BYTES
+            + len(index.chunks) * CHUNK_BYTES)
+
+
+def relabel(document, name):
+    """The same shared document under another upload name; only the chunk labels are copied"""
+    if document.name == name:
+        return document
+    return document._replace(name=name, index=document.index.relabel(name))
+
+
+class _Shared:
+    __slots__ = ("document", "size", "refs", "idle_since")
+
+    def __init__(self, document, size):
+        self.document = document
+        self.size = size
+        self.refs = 0
+        self.idle_since = None
+
+
+class DocumentRegistry:
+    """Indexed documents shared by every session in the process, keyed by content hash
+
+    Sessions that open the same PDF get the same pages, index and bytes.
+    acquire() adds a reference and release() drops it. A document nobody holds
+    stays cached for idle_seconds so a re-upload is instant, and unheld
+    documents go oldest first once resident bytes pass max_bytes. Documents
+    still held are never dropped.
+    """
+
+    def __init__(self, max_bytes=SHARED_MAX_BYTES, idle_seconds=SHARED_IDLE_SECONDS):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self._shared = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+        self.resident_bytes = 0
+        self.builds = 0
+        self.reuses = 0
+
+    def _take(self, doc_hash, name):
+        shared = self._shared.get(doc_hash)
+        if shared is None:
+            return None
+        shared.refs += 1
+        shared.idle_since = None
+        self.reuses += 1
+        return relabel(shared.document, name)
+
+    def acquire(self, doc_hash, name, build):
+        """Shared document for doc_hash, labelled name, with one more reference
+
+        build() returns the IndexedDocument and only runs when no session has
+        it; concurrent uploads of the same PDF wait for a single build.
+        """
+        with self._lock:
+            document = self._take(doc_hash, name)
+            if document is not None:
+                return document
+            build_lock = self._building.setdefault(doc_hash, threading.Lock())
+        with build_lock:
+            with self._lock:
+                document = self._take(doc_hash, name)
+                if document is not None:
+                    return document
+            try:
+                document = build()
+            finally:
+                with self._lock:
+                    self._building.pop(doc_hash, None)
+            with self._lock:
+                shared = _Shared(document, estimate_bytes(document))
+                shared.refs = 1
+                self._shared[doc_hash] = shared
+                self.resident_bytes += shared.size
+                self.builds += 1
+                self._evict()
+            return relabel(document, name)
+
+    def release(self, doc_hash):
+        with self._lock:
+            shared = self._shared.get(doc_hash)
+            if shared is None or shared.refs == 0:
+                return
+            shared.refs -= 1
+            if shared.refs == 0:
+                shared.idle_since = time.monotonic()
+                self._shared.move_to_end(doc_hash)
+            self._evict()
+
+    def _evict(self):
+        now = time.monotonic()
+        idle = [doc_hash for doc_hash, shared in self._shared.items() if shared.refs == 0]
+        for doc_hash in idle:
+            shared = self._shared[doc_hash]
+            expired = now - shared.idle_since >= self.idle_seconds
+            if expired or self.resident_bytes > self.max_bytes:
+                del self._shared[doc_hash]
+                self.resident_bytes -= shared.size
+                print(f"[DEBUG] Dropped shared document {shared.document.name} ({'idle' if expired else 'memory cap'})")
+
+    def collect(self):
+        """Drop documents idle for longer than idle_seconds"""
+        with self._lock:
+            self._evict()
+
+    def report(self):
+        """One row per shared document: references, resident bytes and idle time"""
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "document": shared.document.name,
+                "doc_hash": doc_hash[:12],
+                "refs": shared.refs,
+                "resident_mb": round(shared.size / (1024 * 1024), 2),
+                "idle_s": round(now - shared.idle_since, 1) if shared.idle_since is not None else 0.0,
+            } for doc_hash, shared in self._shared.items()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._shared),
+                "resident_bytes": self.resident_bytes,
+                "held": sum(1 for shared in self._shared.values() if shared.refs),
+                "builds": self.builds,
+                "reuses": self.reuses,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = DocumentRegistry()
+        return _registry
+
+
+def _release_all(registry, documents):
+    for doc_hash in list(documents):
+        registry.release(doc_hash)
+
+
+class DocumentStore:
+    """Indexed documents of one session, keyed by content hash, with LRU eviction
+
+    Eviction keeps at most max_documents and stays under max_bytes, but never
+    drops the document that was just added. With a registry, the store owns
+    one reference per document it holds and releases it when the document
+    leaves, or when the store itself is garbage collected with its session.
+    """
+
+    def __init__(self, max_documents=MAX_DOCUMENTS, max_bytes=MAX_BYTES, registry=None):
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.registry = registry
+        self._documents = OrderedDict()
+        self._sizes = {}
+        self.resident_bytes = 0
+        if registry is not None:
+            weakref.finalize(self, _release_all, registry, self._documents)
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __contains__(self, doc_hash):
+        return doc_hash in self._documents
+
+    def add(self, document):
+        """Store an indexed document; returns the documents evicted to make room"""
+        if document.doc_hash in self._documents:
+            self._documents.move_to_end(document.doc_hash)
+            # Already held: give back the reference acquired for this copy
+            if self.registry is not None:
+                self.registry.release(document.doc_hash)
+            return []
+        size = estimate_bytes(document)
+        self._documents[document.doc_hash] = document
+        self._sizes[document.doc_hash] = size
+        self.resident_bytes += size
+
+        evicted = []
+        while len(self._documents) > 1 and (
+            len(self._documents) > self.max_documents or self.resident_bytes > self.max_bytes
+        ):
+            doc_hash = next(iter(self._documents))
+            evicted.append(self.remove(doc_hash))
+        for old in evicted:
+            print(f"[DEBUG] Evicted document {old.name} from session store")
+        return evicted
+
+    def get(self, doc_hash):
+        """Return the document and mark it as recently used, or None"""
+        document = self._documents.get(doc_hash)
+        if document is not None:
+            self._documents.move_to_end(doc_hash)
+        return document
+
+    def select(self, doc_hashes):
+        """Documents for the given hashes, in that order, skipping any that were evicted"""
+        return [document for document in map(self.get, doc_hashes) if document is not None]
+
+    def remove(self, doc_hash):
+        document = self._documents.pop(doc_hash, None)
+        if document is not None:
+            self.resident_bytes -= self._sizes.pop(doc_hash)
+            if self.registry is not None:
+                self.registry.release(doc_hash)
+        return document
+
+    def documents(self):
+        """All stored documents, least recently used first"""
+        return list(self._documents.values())
+
+    def clear(self):
+        if self.registry is not None:
+            _release_all(self.registry, self._documents)
+        self._documents.clear()
+        self._sizes.clear()
+        self.resident_bytes = 0
+
+    def stats(self):
+        return {
+            "documents": len(self._documents),
+            "resident_bytes": self.resident_bytes,
+            "max_documents": self.max_documents,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,124 @@
+import os
+import random
+import threading
+import time
+
+# Settings for the mock backend (MODEL_BACKEND=mock): seconds before the first piece, seconds
+# between streamed pieces, share of calls that fail and the status they fail with, answer length
+MOCK_LATENCY = float(os.environ.get("MOCK_LATENCY", "0.5"))
+MOCK_TOKEN_LATENCY = float(os.environ.get("MOCK_TOKEN_LATENCY", "0.01"))
+MOCK_ERROR_RATE = float(os.environ.get("MOCK_ERROR_RATE", "0"))
+MOCK_ERROR_CODE = int(os.environ.get("MOCK_ERROR_CODE", "503"))
+MOCK_ANSWER_WORDS = int(os.environ.get("MOCK_ANSWER_WORDS", "80"))
+MOCK_SEED = os.environ.get("MOCK_SEED")
+# About one token per streamed piece
+MOCK_CHUNK_CHARS = 4
+
+
+class FakeAPIError(Exception):
+    """Stands in for google.api_core errors; code is the HTTP status"""
+
+    def __init__(self, code, message="Injected error"):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def mock_answer(prompt, words=MOCK_ANSWER_WORDS):
+    """Answer of about the given length that names the question it replies to"""
+    question = prompt.rpartition("Question:")[2].split("\n", 1)[0].strip() or "your question"
+    filler = ("This mock answer stands in for the model and cites the claim document on page 1 "
+              "so the app can be exercised without calling the API.").split()
+    body = " ".join(filler[i % len(filler)] for i in range(max(words - len(question.split()) - 3, 0)))
+    return f"Mock answer to: {question} {body}".strip()
+
+
+class FakeGenerativeModel:
+    """Deterministic local stand-in for genai.GenerativeModel
+
+    latency is slept per call and token_latency between streamed pieces of
+    chunk_chars characters (a non-streamed call sleeps for all of them).
+    failures is a list of exceptions raised by the first calls (one per call);
+    after that, error_rate of the calls fail with FakeAPIError(error_code).
+    responder maps a prompt to the answer text. Every prompt is recorded in
+    calls so tests can assert what was sent, every prefix uploaded through
+    cache_prefix in cached_prefixes and every one removed in deleted_prefixes.
+    """
+
+    def __init__(self, model_name="fake-gemini", latency=0.0, responder=None, failures=None, chunk_chars=16,
+                 token_latency=0.0, error_rate=0.0, error_code=503, seed=None):
+        self.model_name = model_name
+        self.latency = latency
+        self.responder = responder or (lambda prompt: f"Fake answer ({len(prompt)} prompt characters).")
+        self.failures = list(failures or [])
+        self.chunk_chars = chunk_chars
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.calls = []
+        self.cached_prefixes = []
+        self.deleted_prefixes = []
+        self.injected_errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, model_name="mock-gemini"):
+        """The mock backend, configured by the MOCK_* environment variables"""
+        return cls(model_name, latency=MOCK_LATENCY, responder=mock_answer, chunk_chars=MOCK_CHUNK_CHARS,
+                   token_latency=MOCK_TOKEN_LATENCY, error_rate=MOCK_ERROR_RATE, error_code=MOCK_ERROR_CODE,
+                   seed=MOCK_SEED)
+
+    def generate_content(self, contents, stream=False, request_options=None, **kwargs):
+        return self._respond(contents, contents, stream)
+
+    def cache_prefix(self, text, ttl):
+        """Stand-in for CachedContent.create plus GenerativeModel.from_cached_content"""
+        with self._lock:
+            self.cached_prefixes.append(text)
+        return FakeCachedModel(self, text)
+
+    def delete_prefix(self, model):
+        """Stand-in for CachedContent.delete"""
+        with self._lock:
+            self.deleted_prefixes.append(model.prefix)
+
+    def _respond(self, sent, prompt, stream):
+        with self._lock:
+            self.calls.append(sent)
+            failure = self.failures.pop(0) if self.failures else None
+            if failure is None and self.error_rate and self._random.random() < self.error_rate:
+                self.injected_errors += 1
+                failure = FakeAPIError(self.error_code, "Injected mock error")
+        if self.latency:
+            time.sleep(self.latency)
+        if failure is not None:
+            raise failure
+        text = self.responder(prompt)
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+        if not stream:
+            if self.token_latency:
+                time.sleep(self.token_latency * len(pieces))
+            return FakeResponse(text)
+        return self._stream(pieces)
+
+    def _stream(self, pieces):
+        for number, piece in enumerate(pieces):
+            if number and self.token_latency:
+                time.sleep(self.token_latency)
+            yield FakeResponse(piece)
+
+
+class FakeCachedModel:
+    """Model bound to a cached prefix: only the suffix is sent, the responder sees both"""
+
+    def __init__(self, base, prefix):
+        self.base = base
+        self.prefix = prefix
+
+    def generate_content(self, contents, stream=False, request_options=None, **kwargs):
+        return self.base._respond(contents, self.prefix + contents, stream)
@@ -1,64 +1,547 @@
-import google.generativeai as genai
-import PyPDF2
-import re
 import gc
 import os
+import hashlib
+import time
+import weakref
+import answer_cache
+import claim_extractor
+import document_store
+import glossary
+import line_items
+import model_registry
+import parallel_extract
+import prompt_cache
+import retrieval
+import text_cache
+import text_normalize
+import token_count
+import tracing
 
-def process_pdf_from_file(file_path, api_key):
-    """Process PDF using the best available model"""
-    try:
-        # Configure Gemini with the best model from your list
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')  # Using the latest stable model
-        
-        # Extract text from PDF using PyPDF2
-        pdf_text = ""
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    pdf_text += page_text + " "
-        
-        # Clean text
-        pdf_text = re.sub(r'[\n\xa0\s]+', ' ', pdf_text).strip()
-        pdf_text = re.sub(r'\u200b', '', pdf_text).strip()
-        
-        # Limit text for memory efficiency
-        if len(pdf_text) > 12000:
-            pdf_text = pdf_text[:12000]
-        
-        print(f"[SUCCESS] Using model: models/gemini-2.5-flash | PDF text length: {len(pdf_text)}")
-        
-        def answer_question(question):
-            prompt = f"""You are an AI assistant that answers questions based on document content.
+# Retrieval settings: ranked candidates are packed into the prompt until the token budget is spent
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP = 200
+RETRIEVAL_CANDIDATES = 24
+PROMPT_TOKEN_LIMIT = int(os.environ.get("PROMPT_TOKEN_LIMIT", "4000"))
+# Part of the remaining budget kept for glossary definitions in expert prompts
+GLOSSARY_TOKEN_SHARE = 0.2
 
-Document Content:
-{pdf_text}
-
-Question: {question}
+# Prompts are an instructions + context prefix followed by the question. With PROMPT_CACHE=1 the
+# prefix holds the whole document and is uploaded once per document while a chain holds it.
+BASIC_PREFIX_TEMPLATE = """You are an AI assistant that answers questions based on document content.
 
 Instructions:
-- Answer based ONLY on the document content above
-- Be accurate and concise  
+- Answer based ONLY on the document content below
+- Be accurate and concise
 - If information is not in the document, say "Information not found in the document"
+- Cite the document and page each figure comes from, e.g. (estimate.pdf, page 3)
 - For insurance documents, look for RCV, ACV, depreciation amounts, claim details, etc.
 
+Document Content (marked with their document and page):
+{document}
+"""
+
+BASIC_QUESTION_TEMPLATE = """
+Question: {question}
+
 Answer:"""
-            
-            try:
-                response = model.generate_content(prompt)
-                return {"answer": response.text}
-            except Exception as e:
-                return {"answer": f"Error generating response: {str(e)}"}
+
+EXPERT_PREFIX_TEMPLATE = """You are an expert insurance advisor helping customers understand their insurance claims.
+
+Instructions:
+1. **Find specific information** from the USER'S CLAIM DOCUMENT (amounts, dates, policy details, etc.)
+2. **Use the GLOSSARY** to explain any insurance terminology in simple, clear language
+3. **Combine both** to give a complete, educational answer
+
+Your answer should:
+- Start with specific information from the claim document (if available)
+- Cite the document and page each figure comes from, e.g. (estimate.pdf, page 3)
+- Explain insurance terms using the glossary definitions in simple language
+- Be educational and easy to understand for non-insurance experts
+- If information isn't available, clearly state that
+
+Example format for "What is my ACV?":
+"Your ACV is $X,XXX [from claim document]. ACV stands for Actual Cash Value, which means [definition from glossary in simple terms]..."
+
+USER'S INSURANCE CLAIM DOCUMENT (marked with its document and page):
+{document}
+
+INSURANCE TERMS GLOSSARY (Definitions of insurance terms used in the question and the claim):
+{glossary}
+"""
+
+EXPERT_QUESTION_TEMPLATE = """
+Question: {question}
+
+Expert Answer:"""
+
+# Sent with questions asked in a chat_session.ChatSession, ahead of the question
+HISTORY_TEMPLATE = """
+Conversation so far (the question may refer back to it):
+{history}
+"""
+
+# Sent with questions about individual lines, rooms or categories, ahead of the question
+LINE_ITEM_TEMPLATE = """
+Line item figures computed exactly from the estimate table (use these numbers and explain them rather than re-adding the lines):
+{facts}
+"""
+
+def iter_pdf_pages(data):
+    """Yield the cleaned text of each page as soon as it has been extracted
+
+    Large PDFs are sharded across a process pool; pages still arrive in order.
+    """
+    for page_text in tracing.traced_iter("extract_page", parallel_extract.iter_page_texts(data)):
+        with tracing.span("clean_page", chars=len(page_text)):
+            cleaned = text_normalize.normalize_pdf_text(page_text)
+        yield cleaned
+
+def iter_cached_pdf_pages(data, key=None):
+    """Yield cleaned pages, from the on-disk text cache when the bytes were seen before
+
+    Only a pass that reaches the last page is written back to the cache, so a
+    consumer that stops early never stores a partial document.
+    """
+    cache = text_cache.get_text_cache()
+    key = key or text_cache.content_hash(data)
+    pages = cache.get(key)
+    tracing.annotate(text_cache_hit=pages is not None)
+    if pages is not None:
+        print(f"[SUCCESS] Text cache hit: {len(pages)} pages")
+        yield from pages
+        return
+    
+    extracted = []
+    for page_text in iter_pdf_pages(data):
+        extracted.append(page_text)
+        yield page_text
+    cache.put(key, extracted)
+
+def extract_pdf_pages(data, key=None):
+    """Extract cleaned text for every page of a PDF (empty string for blank pages)"""
+    return list(iter_cached_pdf_pages(data, key))
+
+def scan_pdf_amounts(data, stop_at_summary=True):
+    """Run the structured extractor over pages as they arrive
+
+    With stop_at_summary, extraction stops at the first page that carries
+    RCV, ACV and depreciation together. Returns (amounts, pages_scanned).
+    """
+    scanner = claim_extractor.ClaimAmountScanner()
+    pages_scanned = 0
+    page_iter = iter_cached_pdf_pages(data)
+    with tracing.span("scan_amounts", bytes=len(data)) as span:
+        try:
+            for page_num, page_text in enumerate(page_iter, start=1):
+                scanner.feed(page_num, page_text)
+                pages_scanned = page_num
+                if stop_at_summary and scanner.summary_page is not None:
+                    break
+        finally:
+            page_iter.close()
+        span.set(pages=pages_scanned, summary_page=scanner.summary_page or 0)
+    return scanner.results(), pages_scanned
+
+def read_pdf_bytes(pdf_source):
+    """Return the PDF as one immutable bytes object, copying only when unavoidable
+
+    Accepts bytes, a memoryview/bytearray, a file-like object (Streamlit's
+    UploadedFile, BytesIO, an open file) or a path. BytesIO.getvalue() hands
+    back the buffer the upload already holds, and PdfReader(BytesIO(bytes))
+    reads it in place, so an upload is never duplicated.
+    """
+    if isinstance(pdf_source, bytes):
+        return pdf_source
+    if isinstance(pdf_source, memoryview):
+        if isinstance(pdf_source.obj, bytes) and pdf_source.nbytes == len(pdf_source.obj):
+            return pdf_source.obj
+        return pdf_source.tobytes()
+    if isinstance(pdf_source, bytearray):
+        return bytes(pdf_source)
+    if isinstance(pdf_source, (str, os.PathLike)):
+        with open(pdf_source, 'rb') as file:
+            return file.read()
+    if hasattr(pdf_source, "getvalue"):
+        return pdf_source.getvalue()
+    if hasattr(pdf_source, "read"):
+        if hasattr(pdf_source, "seek"):
+            pdf_source.seek(0)
+        return pdf_source.read()
+    raise TypeError(f"Unsupported PDF source: {type(pdf_source).__name__}")
+
+def build_document_index(pdf_source, doc_name=None, doc_hash=None):
+    """Chunk, index and scan the PDF in a single pass over its pages
+
+    pdf_source is anything read_pdf_bytes accepts; doc_name labels the chunks
+    for citations. Returns (doc_hash, pages, index, amounts); doc_hash keys
+    the text and answer caches and amounts maps field -> ExtractedAmount.
+    """
+    data = read_pdf_bytes(pdf_source)
+    doc_hash = doc_hash or text_cache.content_hash(data)
+    
+    pages = []
+    index = retrieval.BM25Index()
+    scanner = claim_extractor.ClaimAmountScanner()
+    with tracing.span("index_document", doc_hash=doc_hash[:12], bytes=len(data)) as span:
+        for page_num, page_text in enumerate(iter_cached_pdf_pages(data, doc_hash), start=1):
+            pages.append(page_text)
+            index.add(retrieval.chunk_page(page_num, page_text, CHUNK_CHARS, CHUNK_OVERLAP, doc_name))
+            scanner.feed(page_num, page_text)
+        amounts = scanner.results()
+        span.set(pages=len(pages), chunks=len(index), amounts=len(amounts))
+    return doc_hash, pages, index, amounts
+
+def index_document(pdf_source, name, registry=None):
+    """Index one upload for the session document store
+
+    With a document_store.DocumentRegistry, a PDF that another session already
+    opened is not indexed again: the shared copy comes back with one more
+    reference, which the caller's store releases.
+    """
+    data = read_pdf_bytes(pdf_source)
+    doc_hash = text_cache.content_hash(data)
+    
+    def build():
+        _, pages, index, amounts = build_document_index(data, name, doc_hash)
+        return document_store.IndexedDocument(name, doc_hash, data, pages, index, amounts)
+    
+    if registry is None:
+        return build()
+    return registry.acquire(doc_hash, name, build)
+
+def combine_documents(documents):
+    """(doc_hash, pages, index, amounts) across several indexed documents
+
+    The BM25 indexes are merged without re-tokenizing, and the combined hash
+    does not depend on selection order so cached answers are shared. amounts
+    are those of the first document.
+    """
+    if len(documents) == 1:
+        document = documents[0]
+        return document.doc_hash, document.pages, document.index, document.amounts
+    doc_hash = hashlib.sha256("|".join(sorted(d.doc_hash for d in documents)).encode('utf-8')).hexdigest()
+    pages = [page for document in documents for page in document.pages]
+    index = retrieval.BM25Index.merge(document.index for document in documents)
+    return doc_hash, pages, index, documents[0].amounts
+
+def load_claim(claim):
+    """Index a PDF source, or combine a list of documents from the session store"""
+    if isinstance(claim, (list, tuple)):
+        if not claim:
+            raise ValueError("No documents selected")
+        return combine_documents(claim)
+    return build_document_index(claim)
+
+def document_context(claim, pages):
+    """Every page of the claim with source markers, for a cached prompt prefix"""
+    if isinstance(claim, (list, tuple)):
+        # The same text whatever order the documents were selected in, so the cached prefix is shared
+        ordered = sorted(claim, key=lambda document: (document.name, document.doc_hash))
+        return "\n\n".join(retrieval.format_pages(document.pages, document.name) for document in ordered)
+    return retrieval.format_pages(pages)
+
+def load_line_items(claim, doc_hash):
+    """line_items.LineItemTable for a claim, extracted on first use and kept per content hash"""
+    # IndexedDocument is a namedtuple, so it has to be told apart from a list of documents first
+    if isinstance(claim, document_store.IndexedDocument):
+        return line_items.get_table(doc_hash, lambda: line_items.extract_table(claim.data))
+    if isinstance(claim, (list, tuple)):
+        if len(claim) == 1:
+            return load_line_items(claim[0], claim[0].doc_hash)
+        return line_items.get_table(doc_hash, lambda: line_items.LineItemTable.concat(
+            (document.name, load_line_items(document, document.doc_hash)) for document in claim))
+    return line_items.get_table(doc_hash, lambda: line_items.extract_table(read_pdf_bytes(claim)))
+
+def line_item_facts(claim, doc_hash, question):
+    """LINE_ITEM_TEMPLATE filled in for a question about line items, or an empty string"""
+    if not line_items.asks_about_line_items(question):
+        return ""
+    try:
+        facts = line_items.question_facts(load_line_items(claim, doc_hash), question)
+    except Exception as e:
+        print(f"[DEBUG] Line item extraction failed: {str(e)}")
+        return ""
+    return LINE_ITEM_TEMPLATE.format(facts=facts) if facts else ""
+
+def conversation(input_dict):
+    """(history, search) a ChatSession adds to a question; ("", None) for a single question"""
+    return input_dict.get("history", ""), input_dict.get("search")
+
+def history_block(history):
+    return HISTORY_TEMPLATE.format(history=history) if history else ""
+
+def static_prompt_prefix(client, render):
+    """Prompt prefix cached on the backend, or None to keep per-question retrieval
+
+    render() builds the prefix text and is only called when the client can
+    cache contexts; prefixes outside the prompt_cache token limits are skipped.
+    Nothing is uploaded here: the caller registers the prefix with the cache.
+    """
+    if client.prefix_cache is None:
+        return None
+    with tracing.span("prefix_build") as span:
+        prefix = prompt_cache.static_prefix(render())
+        span.set(prefix_tokens=prefix.tokens if prefix else None)
+    return prefix
+
+def live_prefix(client, prefix):
+    """prefix once the backend holds it (re-uploaded near expiry), else None for a retrieval prompt"""
+    if prefix is None or client.prefix_cache.model_for(prefix) is None:
+        return None
+    return prefix
+
+def select_context(index, question, budget):
+    """Pack the best-ranked chunks for the question into the token budget"""
+    with tracing.span("retrieval", chunks=len(index)) as span:
+        hits = index.search(question, RETRIEVAL_CANDIDATES)
+        used = budget.used
+        chosen = budget.fill(hits, render=lambda hit: retrieval.format_chunks([hit]))
+        span.set(candidates=len(hits), selected=len(chosen), context_tokens=budget.used - used)
+    return retrieval.format_chunks(chosen)
+
+def answer_scope(claim, doc_hash):
+    """What cached answers are keyed by: the content hash, plus the file names their citations use
+
+    The same bytes uploaded under another name must not be served answers
+    that cite the first upload's name.
+    """
+    if isinstance(claim, document_store.IndexedDocument):
+        names = [claim.name]
+    elif isinstance(claim, (list, tuple)):
+        names = sorted(document.name for document in claim)
+    else:
+        return doc_hash
+    return f"{doc_hash}|{'|'.join(names)}"
+
+def answer_key(cache, doc_hash, question, glossary_version, model_tag, history=""):
+    """Answer cache key; a follow-up is only reused within the same conversation"""
+    return cache.make_key(doc_hash, f"{history}\n{question}" if history else question, glossary_version, model_tag)
+
+def cached_answer(answer_fn, doc_hash, glossary_version, model_tag, question, history="", search=None):
+    """Serve repeated questions from the answer cache, calling the model only on a miss"""
+    cache = answer_cache.get_answer_cache()
+    key = answer_key(cache, doc_hash, question, glossary_version, model_tag, history)
+    with tracing.span("answer", question_chars=len(question)) as span:
+        answer = cache.get(key)
+        span.set(answer_cache_hit=answer is not None)
+        if answer is not None:
+            return {"answer": answer, "cached": True}
+        result = answer_fn(question, history, search)
+        if not result.get("error"):
+            cache.put(key, result["answer"])
+        span.set(answer_chars=len(result["answer"]), error=bool(result.get("error")))
+        return result
+
+class AnswerStream:
+    """Iterable of cleaned answer pieces
+
+    After iteration finishes, answer holds the raw model text and cached/error
+    tell the caller how it was produced.
+    """
+    
+    def __init__(self, pieces, on_complete=None, cached=False, error_label="Error generating response"):
+        self._pieces = pieces
+        self._on_complete = on_complete
+        self._error_label = error_label
+        self.cached = cached
+        self.error = False
+        self.answer = ""
+        # Ended when iteration finishes; the model call inside is timed by the client
+        self._span = tracing.start_span("answer_stream", answer_cache_hit=cached)
+    
+    def __iter__(self):
+        cleaner = text_normalize.AnswerNormalizer()
+        raw = []
+        clean_ns = 0
+        try:
+            for piece in self._pieces:
+                raw.append(piece)
+                started = time.perf_counter_ns()
+                cleaned = cleaner.feed(piece)
+                clean_ns += time.perf_counter_ns() - started
+                if cleaned:
+                    yield cleaned
+            tail = cleaner.flush()
+            if tail:
+                yield tail
+        except Exception as e:
+            self.error = True
+            message = f"{self._error_label}: {str(e)}"
+            raw.append(message)
+            yield (' ' if cleaner.started else '') + message
+        finally:
+            self._span.set(pieces=len(raw), answer_chars=sum(map(len, raw)),
+                           post_process_ms=round(clean_ns / 1e6, 3), error=self.error).end()
+        self.answer = ''.join(raw)
+        if not self.error and self._on_complete:
+            self._on_complete(self.answer)
+
+def cached_answer_stream(stream_fn, doc_hash, glossary_version, model_tag, question, error_label, history="",
+                         search=None):
+    """Streaming counterpart of cached_answer"""
+    cache = answer_cache.get_answer_cache()
+    key = answer_key(cache, doc_hash, question, glossary_version, model_tag, history)
+    answer = cache.get(key)
+    if answer is not None:
+        return AnswerStream(iter([answer]), cached=True)
+    return AnswerStream(stream_fn(question, history, search), lambda text: cache.put(key, text), error_label=error_label)
+
+def cached_answer_many(client, build_prompt, doc_hash, glossary_version, model_tag, questions, error_label,
+                       prefix=None):
+    """Answer independent questions together, sending every cache miss to the model concurrently"""
+    cache = answer_cache.get_answer_cache()
+    results = [None] * len(questions)
+    misses = []
+    with tracing.span("answer_many", questions=len(questions)) as span:
+        for i, question in enumerate(questions):
+            key = answer_key(cache, doc_hash, question, glossary_version, model_tag)
+            answer = cache.get(key)
+            if answer is not None:
+                results[i] = {"answer": answer, "cached": True}
+            else:
+                misses.append((i, key))
+        span.set(answer_cache_hits=len(questions) - len(misses))
         
-        gc.collect()
+        if misses:
+            answers = client.generate_many([build_prompt(questions[i]) for i, _ in misses], prefix=prefix)
+            for (i, key), answer in zip(misses, answers):
+                if isinstance(answer, Exception):
+                    results[i] = {"answer": f"{error_label}: {str(answer)}", "error": True}
+                else:
+                    cache.put(key, answer)
+                    results[i] = {"answer": answer}
+        span.set(errors=sum(1 for result in results if result.get("error")))
+    return results
+
+class ClaimRAG:
+    """Questions about an indexed claim, or several documents searched together
+
+    prefix_template and question_template frame every prompt; with a
+    glossary_index the prefix also carries the definitions a question needs.
+    Each question gets a retrieval prompt within PROMPT_TOKEN_LIMIT, or only
+    its suffix while the backend holds the claim's cached prefix, and is
+    answered through the answer cache. mode names the prompt spans. The
+    prefix uploads in the background and is deleted by close(), or when the
+    chain is garbage collected.
+    """
+    
+    def __init__(self, client, model_tag, claim, loaded, prefix_template, question_template, glossary_version,
+                 error_label, mode, glossary_index=None):
+        doc_hash, pages, index, amounts = loaded
+        self.client = client
+        self.model_tag = model_tag
+        self.claim = claim
+        self.index = index
+        self.prefix_template = prefix_template
+        self.question_template = question_template
+        self.glossary_version = glossary_version
+        self.error_label = error_label
+        self.mode = mode
+        self.glossary_index = glossary_index
+        # Locally extracted figures (field -> ExtractedAmount), no model call needed
+        self.amounts = amounts
+        # Content hash of the claim PDF, shared with the text and answer caches
+        self.pdf_hash = doc_hash
+        self.answer_doc = answer_scope(claim, doc_hash)
+        # Whole claim (and glossary), built once and cached by the backend; questions then only send their suffix
+        self.prefix = static_prompt_prefix(client, lambda: self.render_prefix(document_context(claim, pages)))
+        if self.prefix is not None:
+            client.prefix_cache.register(self.prefix)
+            self._release = weakref.finalize(self, client.prefix_cache.release, self.prefix)
+    
+    def close(self):
+        """Release the cached prefix; the last chain holding it deletes it from the backend"""
+        if self.prefix is not None:
+            self._release()
+    
+    def render_prefix(self, document, glossary_text=None):
+        if glossary_text is None and self.glossary_index is not None:
+            glossary_text = self.glossary_index.format_definitions(self.glossary_index.entries) or "(No glossary available)"
+        return self.prefix_template.format(document=document, glossary=glossary_text or "")
+    
+    def build_prompt(self, question, history="", search=None, prefix=None):
+        """What follows prefix when the backend holds it, or the whole retrieval prompt"""
+        with tracing.span("prompt_build", mode=self.mode, prefix_cached=prefix is not None) as span:
+            facts = line_item_facts(self.claim, self.pdf_hash, question)
+            delta = history_block(history) + facts
+            span.set(line_item_facts=bool(facts), history_chars=len(history))
+            if prefix is not None:
+                prompt = delta + self.question_template.format(question=question)
+            else:
+                budget = token_count.TokenBudget(PROMPT_TOKEN_LIMIT)
+                budget.reserve(self.prefix_template)
+                budget.reserve(self.question_template)
+                budget.reserve(question, static=False)
+                budget.reserve(delta, static=False)
+                glossary_budget = budget.split(GLOSSARY_TOKEN_SHARE) if self.glossary_index is not None else None
+                document = select_context(self.index, search or question, budget)
+                glossary_text = None
+                if glossary_budget is not None:
+                    glossary_index = self.glossary_index
+                    terms = glossary_budget.fill(glossary_index.lookup(question, document),
+                                                 render=lambda term: glossary_index.format_definitions([term]),
+                                                 separator="\n")
+                    glossary_text = glossary_index.format_definitions(terms) or "(No glossary terms apply to this question)"
+                    span.set(glossary_terms=len(terms))
+                prompt = self.render_prefix(document, glossary_text) + delta + \
+                    self.question_template.format(question=question)
+            span.set(prompt_chars=len(prompt), prompt_tokens=token_count.count_tokens(prompt))
+        return prompt
+    
+    def _answer(self, question, history="", search=None):
+        prefix = live_prefix(self.client, self.prefix)
+        try:
+            return {"answer": self.client.generate(self.build_prompt(question, history, search, prefix), prefix=prefix)}
+        except Exception as e:
+            return {"answer": f"{self.error_label}: {str(e)}", "error": True}
+    
+    def _stream(self, question, history="", search=None):
+        prefix = live_prefix(self.client, self.prefix)
+        return self.client.stream(self.build_prompt(question, history, search, prefix), prefix=prefix)
+    
+    def prompt(self, input_dict):
+        """The full prompt for a question, cached prefix included, without calling the model"""
+        prefix = live_prefix(self.client, self.prefix)
+        return (prefix.text if prefix else "") + self.build_prompt(input_dict["input"], *conversation(input_dict), prefix)
+    
+    def invoke(self, input_dict):
+        return cached_answer(self._answer, self.answer_doc, self.glossary_version, self.model_tag, input_dict["input"],
+                             *conversation(input_dict))
+    
+    def invoke_stream(self, input_dict):
+        return cached_answer_stream(self._stream, self.answer_doc, self.glossary_version, self.model_tag,
+                                    input_dict["input"], self.error_label, *conversation(input_dict))
+    
+    def invoke_many(self, input_dicts):
+        prefix = live_prefix(self.client, self.prefix)
+        return cached_answer_many(self.client, lambda question: self.build_prompt(question, prefix=prefix),
+                                  self.answer_doc, self.glossary_version, self.model_tag,
+                                  [d["input"] for d in input_dicts], self.error_label, prefix)
+
+def process_pdf_from_file(pdf_source, api_key, model_config=None):
+    """Process PDF using the configured model
+
+    pdf_source may be a path, bytes, a memoryview, a file-like object or a
+    list of IndexedDocuments to search together.
+    """
+    try:
+        # Shared per process: no genai.configure or new GenerativeModel per upload
+        model_config = model_config or model_registry.DEFAULT_CONFIG
+        client = model_registry.get_client(api_key, model_config)
+        model_tag = model_config.cache_tag
+        
+        # Index the whole document; each question only sees its best chunks
+        loaded = load_claim(pdf_source)
+        _, pages, index, claim_amounts = loaded
         
-        class FastRAG:
-            def invoke(self, input_dict):
-                return answer_question(input_dict["input"])
+        print(f"[SUCCESS] Using model: models/{model_config.model_name} | Pages: {len(pages)} | Chunks: {len(index)} | Amounts found: {len(claim_amounts)}")
         
-        return FastRAG()
+        rag = ClaimRAG(client, model_tag, pdf_source, loaded, BASIC_PREFIX_TEMPLATE, BASIC_QUESTION_TEMPLATE,
+                       "basic", "Error generating response", "basic")
+        
+        gc.collect()
+        
+        return rag
         
     except Exception as e:
         gc.collect()
@@ -73,23 +556,18 @@ def extract_glossary_text(glossary_path):
             print(f"[ERROR] File does not exist: {glossary_path}")
             return None
         
-        glossary_text = ""
-        with open(glossary_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            print(f"[DEBUG] PDF loaded: {len(pdf_reader.pages)} pages")
-            
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                if page_text:
-                    glossary_text += page_text + "\n\n"
-                    print(f"[DEBUG] Page {page_num + 1}: {len(page_text)} characters extracted")
+        glossary_parts = []
+        for page_num, page_text in enumerate(parallel_extract.iter_page_texts(glossary_path)):
+            if page_text:
+                glossary_parts.append(page_text)
+                print(f"[DEBUG] Page {page_num + 1}: {len(page_text)} characters extracted")
         
+        glossary_text = "\n\n".join(glossary_parts)
         if not glossary_text.strip():
             print("[ERROR] No text extracted from PDF")
             return None
         
-        glossary_text = re.sub(r'[\n\xa0\s]+', ' ', glossary_text).strip()
-        glossary_text = re.sub(r'\u200b', '', glossary_text).strip()
+        glossary_text = text_normalize.normalize_pdf_text(glossary_text)
         
         print(f"[SUCCESS] Total glossary text extracted: {len(glossary_text)} characters")
         return glossary_text
@@ -98,77 +576,83 @@ def extract_glossary_text(glossary_path):
         print(f"[ERROR] Exception in extract_glossary_text: {str(e)}")
         return None
 
-def create_expert_claim_system(user_pdf_path, glossary_text, api_key):
-    """Create expert system using the best model"""
-    try:
-        print(f"[SUCCESS] Creating expert claim system with models/gemini-2.5-flash")
-        
-        # Configure with best model
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        # Extract user text
-        user_text = ""
-        with open(user_pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    user_text += page_text + " "
-        
-        # Clean and limit text
-        user_text = re.sub(r'[\n\xa0\s]+', ' ', user_text).strip()
-        user_text = re.sub(r'\u200b', '', user_text).strip()
-        
-        if len(user_text) > 10000:
-            user_text = user_text[:10000]
-        
-        if len(glossary_text) > 5000:
-            glossary_text = glossary_text[:5000]
-        
-        print(f"[SUCCESS] Expert system ready - User claim: {len(user_text)} chars, Glossary: {len(glossary_text)} chars")
-        
-        def expert_answer(question):
-            prompt = f"""You are an expert insurance advisor helping customers understand their insurance claims.
-
-USER'S INSURANCE CLAIM DOCUMENT:
-{user_text}
-
-INSURANCE TERMS GLOSSARY (Contains definitions for RCV, ACV, Depreciation, Deductible, etc.):
-{glossary_text}
+def glossary_artifact_path(glossary_path):
+    """Compiled glossary is stored next to the PDF"""
+    return os.path.splitext(glossary_path)[0] + ".glossary"
 
-Question: {question}
+def glossary_source_hash(glossary_path):
+    with open(glossary_path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
 
-Instructions:
-1. **Find specific information** from the USER'S CLAIM DOCUMENT (amounts, dates, policy details, etc.)
-2. **Use the GLOSSARY** to explain any insurance terminology in simple, clear language
-3. **Combine both** to give a complete, educational answer
+def compile_glossary(glossary_path, source_hash=None):
+    """Parse the glossary PDF and write its compiled artifact; returns the GlossaryIndex or None"""
+    source_hash = source_hash or glossary_source_hash(glossary_path)
+    glossary_text = extract_glossary_text(glossary_path)
+    if not glossary_text:
+        return None
+    index = glossary.GlossaryIndex.from_text(glossary_text, source_hash)
+    try:
+        index.save(glossary_artifact_path(glossary_path))
+    except OSError as e:
+        print(f"[DEBUG] Could not write compiled glossary: {str(e)}")
+    print(f"[SUCCESS] Compiled glossary: {len(index)} terms")
+    return index
 
-Your answer should:
-- Start with specific information from the claim document (if available)
-- Explain insurance terms using the glossary definitions in simple language
-- Be educational and easy to understand for non-insurance experts
-- If information isn't available, clearly state that
+def load_glossary_index(glossary_path):
+    """Memory-map the compiled glossary, recompiling from the PDF only when its hash changed"""
+    try:
+        source_hash = glossary_source_hash(glossary_path)
+    except OSError as e:
+        print(f"[ERROR] Cannot read glossary: {str(e)}")
+        return None
+    
+    artifact_path = glossary_artifact_path(glossary_path)
+    if os.path.exists(artifact_path):
+        try:
+            index = glossary.GlossaryIndex.load(artifact_path, source_hash)
+            print(f"[SUCCESS] Loaded compiled glossary: {len(index)} terms")
+            return index
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[DEBUG] Rebuilding compiled glossary: {str(e)}")
+    
+    return compile_glossary(glossary_path, source_hash)
 
-Example format for "What is my ACV?":
-"Your ACV is $X,XXX [from claim document]. ACV stands for Actual Cash Value, which means [definition from glossary in simple terms]..."
+def create_expert_claim_system(user_pdf, glossary_text, api_key, model_config=None):
+    """Create expert system using the configured model
 
-Expert Answer:"""
-            
-            try:
-                response = model.generate_content(prompt)
-                return {"answer": response.text}
-            except Exception as e:
-                return {"answer": f"Error generating expert response: {str(e)}"}
+    user_pdf may be a path, bytes, a memoryview, a file-like object or a
+    list of IndexedDocuments to search together.
+    """
+    try:
+        # Read once so the basic fallback below reuses the same buffer
+        if not isinstance(user_pdf, (list, tuple)):
+            user_pdf = read_pdf_bytes(user_pdf)
+        model_config = model_config or model_registry.DEFAULT_CONFIG
+        print(f"[SUCCESS] Creating expert claim system with models/{model_config.model_name}")
+        
+        # Shared per process: no genai.configure or new GenerativeModel per upload
+        client = model_registry.get_client(api_key, model_config)
+        model_tag = model_config.cache_tag
+        
+        # Index the whole claim; each question only sees its best chunks
+        loaded = load_claim(user_pdf)
+        _, pages, index, claim_amounts = loaded
+        
+        # Accept either raw glossary text or an already parsed GlossaryIndex
+        if isinstance(glossary_text, glossary.GlossaryIndex):
+            glossary_index = glossary_text
+        else:
+            glossary_index = glossary.GlossaryIndex.from_text(glossary_text)
+        
+        print(f"[SUCCESS] Expert system ready - User claim: {len(pages)} pages / {len(index)} chunks, Glossary: {len(glossary_index)} terms, Amounts found: {len(claim_amounts)}")
         
-        class ExpertRAG:
-            def invoke(self, input_dict):
-                return expert_answer(input_dict["input"])
+        rag = ClaimRAG(client, model_tag, user_pdf, loaded, EXPERT_PREFIX_TEMPLATE, EXPERT_QUESTION_TEMPLATE,
+                       f"expert-{glossary_index.version}", "Error generating expert response", "expert", glossary_index)
         
         gc.collect()
-        return ExpertRAG()
+        return rag
         
     except Exception as e:
         print(f"[ERROR] Error in create_expert_claim_system: {str(e)}")
-        return process_pdf_from_file(user_pdf_path, api_key)
+        return process_pdf_from_file(user_pdf, api_key, model_config)
 
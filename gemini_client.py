@@ -0,0 +1,200 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+import tracing
+
+DEFAULT_TIMEOUT = float(os.environ.get("GEMINI_TIMEOUT", "60"))
+DEFAULT_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", "3"))
+MAX_IN_FLIGHT = int(os.environ.get("GEMINI_MAX_IN_FLIGHT", "8"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+# Rate limits, timeouts and server-side failures are worth another attempt
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_GRPC = {"RESOURCE_EXHAUSTED", "UNAVAILABLE", "INTERNAL", "DEADLINE_EXCEEDED"}
+
+# One in-flight limit for the whole process, shared by every session thread and event loop
+_request_slots = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+
+
+class GeminiError(Exception):
+    """A model call that failed for good (non-retryable, out of retries or past its deadline)"""
+
+    def __init__(self, message, retryable=False, attempts=1):
+        super().__init__(message)
+        self.retryable = retryable
+        self.attempts = attempts
+
+
+def is_retryable(exc):
+    if isinstance(exc, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    code = getattr(exc, "code", None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            return False
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    return getattr(code, "name", None) in RETRYABLE_GRPC
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Full-jitter exponential backoff for the given 0-based retry number"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class GeminiClient:
+    """Shared wrapper around a GenerativeModel with deadlines, retries and a process-wide concurrency cap
+
+    model is anything with a generate_content(prompt, stream=..., request_options=...)
+    method, so a local fake can stand in for the real SDK. prefix_cache is a
+    prompt_cache.PrefixCache when the backend supports cached contexts.
+    """
+
+    def __init__(self, model, timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES, slots=None,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, prefix_cache=None):
+        self.model = model
+        self.prefix_cache = prefix_cache
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._slots = slots or _request_slots
+
+    def _acquire(self, remaining):
+        if not self._slots.acquire(timeout=max(remaining, 0)):
+            raise TimeoutError("Timed out waiting for a free model request slot")
+
+    def _resolve(self, prompt, prefix):
+        """(model, contents) for one call; with a prefix, prompt is the suffix sent to the model bound to it
+
+        A prefix the backend no longer holds is an error rather than being
+        pasted in front of the suffix: that would send the whole document
+        past the prompt token budget on every question.
+        """
+        if prefix is None:
+            return self.model, prompt
+        model = self.prefix_cache.model_for(prefix) if self.prefix_cache else None
+        if model is None:
+            raise GeminiError("Prompt prefix is not cached; send a full prompt without it")
+        return model, prompt
+
+    def _generate_once(self, model, prompt, remaining):
+        self._acquire(remaining)
+        try:
+            response = model.generate_content(prompt, request_options={"timeout": remaining})
+            return response.text
+        finally:
+            self._slots.release()
+
+    def _next_delay(self, exc, attempt, deadline):
+        """Return how long to wait before retrying, or raise GeminiError if we should stop"""
+        retryable = is_retryable(exc)
+        reason = str(exc) or type(exc).__name__
+        if not retryable or attempt > self.max_retries:
+            raise GeminiError(reason, retryable, attempt) from exc
+        delay = backoff_delay(attempt - 1, self.backoff_base, self.backoff_max)
+        if time.monotonic() + delay >= deadline:
+            raise GeminiError(f"Deadline exceeded after {attempt} attempts: {reason}", True, attempt) from exc
+        return delay
+
+    def generate(self, prompt, timeout=None, prefix=None):
+        """Blocking call; timeout is the deadline for the whole call including retries
+
+        With a prompt_cache.PromptPrefix, prompt is the part after it.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+        with tracing.span("model_call") as span:
+            model, prompt = self._resolve(prompt, prefix)
+            span.set(prompt_chars=len(prompt), prefix_cached=model is not self.model)
+            while True:
+                try:
+                    text = self._generate_once(model, prompt, deadline - time.monotonic())
+                    span.set(attempts=attempt + 1, response_chars=len(text))
+                    return text
+                except Exception as e:
+                    attempt += 1
+                    span.set(attempts=attempt)
+                    time.sleep(self._next_delay(e, attempt, deadline))
+
+    async def generate_async(self, prompt, timeout=None, prefix=None):
+        """asyncio version of generate; the blocking SDK call runs in a worker thread"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+        with tracing.span("model_call") as span:
+            model, prompt = await asyncio.to_thread(self._resolve, prompt, prefix)
+            span.set(prompt_chars=len(prompt), prefix_cached=model is not self.model)
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    text = await asyncio.wait_for(
+                        asyncio.to_thread(self._generate_once, model, prompt, remaining), remaining)
+                    span.set(attempts=attempt + 1, response_chars=len(text))
+                    return text
+                except Exception as e:
+                    attempt += 1
+                    span.set(attempts=attempt)
+                    await asyncio.sleep(self._next_delay(e, attempt, deadline))
+
+    async def generate_many_async(self, prompts, timeout=None, prefix=None):
+        """Run independent prompts concurrently; failures come back as GeminiError instances"""
+        return await asyncio.gather(
+            *(self.generate_async(prompt, timeout, prefix) for prompt in prompts),
+            return_exceptions=True,
+        )
+
+    def generate_many(self, prompts, timeout=None, prefix=None):
+        """Blocking batch helper for callers without a running event loop (e.g. Streamlit scripts)"""
+        return asyncio.run(self.generate_many_async(prompts, timeout, prefix))
+
+    def stream(self, prompt, timeout=None, prefix=None):
+        """Yield text pieces as they arrive; retries only happen before the first piece"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+        chars = 0
+        # Not activated: this generator runs in its consumer's context
+        span = tracing.start_span("model_call", stream=True)
+        try:
+            model, prompt = self._resolve(prompt, prefix)
+            span.set(prompt_chars=len(prompt), prefix_cached=model is not self.model)
+            while True:
+                started = False
+                span.set(attempts=attempt + 1)
+                try:
+                    self._acquire(deadline - time.monotonic())
+                    try:
+                        response = model.generate_content(
+                            prompt, stream=True, request_options={"timeout": deadline - time.monotonic()}
+                        )
+                        for chunk in response:
+                            try:
+                                text = chunk.text
+                            except ValueError:
+                                # Chunks without text parts (e.g. a final safety/metadata chunk)
+                                continue
+                            if text:
+                                if not started:
+                                    span.set(first_piece_ms=round(span.duration_ms, 3))
+                                started = True
+                                chars += len(text)
+                                span.set(response_chars=chars)
+                                yield text
+                        return
+                    finally:
+                        self._slots.release()
+                except Exception as e:
+                    attempt += 1
+                    if started:
+                        raise GeminiError(str(e) or type(e).__name__, False, attempt) from e
+                    time.sleep(self._next_delay(e, attempt, deadline))
+        except Exception as e:
+            span.set(error=f"{type(e).__name__}: {str(e)}")
+            raise
+        finally:
+            span.end()
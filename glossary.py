@@ -0,0 +1,174 @@
+import hashlib
+import json
+import mmap
+import re
+import struct
+
+# Bullet entries look like "• (H) Replacement Cost Value (RCV) – The estimated cost ..."
+ENTRY_PATTERN = re.compile(r"^(?:\([A-Z]\)\s*)?(?P<term>[^–]{2,80}?)\s+[–-]\s+(?P<definition>.+)$")
+ACRONYM_PATTERN = re.compile(r"\s*\((?P<acronym>[A-Z][A-Z&/]{1,5})\)\s*$")
+# Unit tables are written as "EA – Each LF – Linear Foot ..."
+UNIT_PATTERN = re.compile(r"\b(?P<acronym>[A-Z]{2})\s+[–-]\s+(?P<name>[A-Z][a-z]+(?:\s+(?:Foot|Yard))?)\b")
+# A run of capitalised words right after a full stop is a section heading, not definition text
+HEADING_PATTERN = re.compile(r"(?<=\.)\s+(?:[A-Z][A-Za-z]*\s+(?:of\s+)?){3,}")
+
+# Everyday shorthand that adjusters use for glossary terms
+COMMON_ALIASES = {
+    "O&P": "overhead and profit",
+    "depr": "depreciation",
+    "ded": "deductible",
+}
+
+MAX_DEFINITIONS = 8
+
+# Compiled glossary: header (magic, format, PDF sha256, section lengths), term index JSON, cleaned text.
+# Bump ARTIFACT_FORMAT when parsing or the layout changes so old artifacts are rebuilt.
+ARTIFACT_MAGIC = b"GLOSSIDX"
+ARTIFACT_FORMAT = 1
+ARTIFACT_HEADER = struct.Struct("<8sH32sII")
+
+
+def _trim_definition(definition):
+    heading = HEADING_PATTERN.search(definition)
+    if heading:
+        definition = definition[:heading.start()]
+    return definition.strip()
+
+
+def parse_glossary(text):
+    """Parse cleaned glossary text into {term: (definition, [aliases])}"""
+    entries = {}
+    for segment in text.split("•"):
+        match = ENTRY_PATTERN.match(segment.strip())
+        if not match:
+            continue
+        term = match.group("term").strip()
+        aliases = []
+        acronym = ACRONYM_PATTERN.search(term)
+        if acronym:
+            aliases.append(acronym.group("acronym"))
+            term = term[:acronym.start()].strip()
+        definition = _trim_definition(match.group("definition"))
+        if term and definition:
+            entries[term] = (definition, aliases)
+
+    for match in UNIT_PATTERN.finditer(text):
+        name = match.group("name")
+        if name not in entries:
+            entries[name] = (f"Unit of measure abbreviated {match.group('acronym')}.", [match.group("acronym")])
+    return entries
+
+
+class GlossaryIndex:
+    """Term -> definition dictionary with an alias/acronym lookup"""
+
+    def __init__(self, entries, source_hash=None, text=None):
+        self.entries = entries
+        self.source_hash = source_hash
+        # Cleaned glossary text, or a (buffer, start, end) slice of a mapped artifact decoded on first use
+        self._text = text
+        payload = json.dumps(entries, sort_keys=True).encode("utf-8")
+        self.version = hashlib.sha256(payload).hexdigest()[:16]
+
+        self.aliases = {}
+        for term, (_, term_aliases) in entries.items():
+            self.aliases[term.lower()] = term
+            for alias in term_aliases:
+                self.aliases[alias.lower() if len(alias) > 2 else alias] = term
+        for alias, target in COMMON_ALIASES.items():
+            for term in entries:
+                if term.lower() == target:
+                    self.aliases[alias.lower()] = term
+
+        # Two-letter unit codes ("EA", "SF") only match in capitals to avoid false hits
+        forms = sorted(self.aliases, key=len, reverse=True)
+        insensitive = [re.escape(f) for f in forms if f == f.lower()]
+        sensitive = [re.escape(f) for f in forms if f != f.lower()]
+        parts = []
+        if insensitive:
+            parts.append(r"(?i:\b(?:" + "|".join(insensitive) + r")(?!\w))")
+        if sensitive:
+            parts.append(r"\b(?:" + "|".join(sensitive) + r")\b")
+        self.pattern = re.compile("|".join(parts)) if parts else None
+
+    @classmethod
+    def from_text(cls, text, source_hash=None):
+        return cls(parse_glossary(text or ""), source_hash, text)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def find_terms(self, text, specific_only=False):
+        """Return glossary terms mentioned in text, in order of first mention
+
+        With specific_only, single everyday words ("Each", "Room") are ignored
+        and only multi-word terms or acronyms count as a mention.
+        """
+        if not text or self.pattern is None:
+            return []
+        found = []
+        for match in self.pattern.finditer(text):
+            form = match.group(0)
+            if specific_only and " " not in form and not form.isupper():
+                continue
+            term = self.aliases.get(form.lower()) or self.aliases.get(form)
+            if term and term not in found:
+                found.append(term)
+        return found
+
+    def lookup(self, question, context="", limit=MAX_DEFINITIONS):
+        """Pick definitions for terms in the question first, then in the retrieved context"""
+        terms = self.find_terms(question)
+        for term in self.find_terms(context, specific_only=True):
+            if len(terms) >= limit:
+                break
+            if term not in terms:
+                terms.append(term)
+        return terms
+
+    def format_definitions(self, terms):
+        lines = []
+        for term in terms:
+            definition, aliases = self.entries[term]
+            label = f"{term} ({', '.join(aliases)})" if aliases else term
+            lines.append(f"- {label}: {definition}")
+        return "\n".join(lines)
+
+    @property
+    def text(self):
+        if isinstance(self._text, tuple):
+            buffer, start, end = self._text
+            self._text = bytes(buffer[start:end]).decode("utf-8")
+        return self._text
+
+    def save(self, path):
+        """Write the compiled artifact; the glossary text is included when known"""
+        if not self.source_hash:
+            raise ValueError("A compiled glossary needs the source PDF hash")
+        index = json.dumps(self.entries, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        text = (self.text or "").encode("utf-8")
+        header = ARTIFACT_HEADER.pack(ARTIFACT_MAGIC, ARTIFACT_FORMAT, bytes.fromhex(self.source_hash),
+                                      len(index), len(text))
+        with open(path, "wb") as file:
+            file.write(header + index + text)
+
+    @classmethod
+    def load(cls, path, source_hash=None):
+        """Memory-map a compiled artifact; raises ValueError if it is malformed, of another format
+        or, when source_hash is given, compiled from a different PDF"""
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(buffer) < ARTIFACT_HEADER.size:
+            raise ValueError("Truncated glossary artifact")
+        magic, version, digest, index_len, text_len = ARTIFACT_HEADER.unpack_from(buffer)
+        if magic != ARTIFACT_MAGIC or version != ARTIFACT_FORMAT:
+            raise ValueError(f"Not a format {ARTIFACT_FORMAT} glossary artifact")
+        if source_hash is not None and digest.hex() != source_hash:
+            raise ValueError("Glossary artifact was compiled from a different PDF")
+        start = ARTIFACT_HEADER.size
+        if len(buffer) < start + index_len + text_len:
+            raise ValueError("Truncated glossary artifact")
+        entries = json.loads(bytes(buffer[start:start + index_len]).decode("utf-8"))
+        entries = {term: (value[0], list(value[1])) for term, value in entries.items()}
+        text_start = start + index_len
+        return cls(entries, digest.hex(), (buffer, text_start, text_start + text_len))
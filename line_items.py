@@ -0,0 +1,423 @@
+import io
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from decimal import Decimal
+
+import numpy as np
+import PyPDF2
+from PyPDF2.generic import ContentStream
+
+try:
+    # Private in PyPDF2 (pinned to 3.0.1 in requirements.txt); without it rows are parsed from extract_text
+    from PyPDF2._cmap import build_char_map
+except ImportError:
+    build_char_map = None
+
+import claim_extractor
+import tracing
+
+LINE_ITEM_CACHE_MAX = int(os.environ.get("LINE_ITEM_CACHE_MAX", "16"))
+# Fragments whose baselines differ by less than this many points share a row
+ROW_TOLERANCE = 2.0
+# Average glyph width as a share of the font size, for estimating where a fragment ends
+GLYPH_WIDTH = 0.5
+
+# One shown string and where it starts on the page (PDF points, origin bottom left)
+Fragment = namedtuple("Fragment", ["x", "y", "end", "text"])
+# One row of the estimate; money columns are Decimals
+LineItem = namedtuple("LineItem", ["number", "description", "room", "page", "quantity", "unit", "unit_price",
+                                   "rcv", "depreciation", "acv"])
+
+MONEY_COLUMNS = ("unit_price", "rcv", "depreciation", "acv")
+COLUMN_LABELS = {
+    "quantity": "quantity",
+    "unit_price": "unit price",
+    "rcv": "RCV",
+    "depreciation": "depreciation",
+    "acv": "ACV",
+}
+
+NUMBER = r"[(<]?-?\$?\d[\d,]*(?:\.\d+)?[)>]?"
+# "12. Remove and replace drywall 12.00 SF 3.25 [tax] 39.00 (5.00) 34.00" when a row comes out as one string
+ROW_PATTERN = re.compile(
+    r"^(?:(?P<number>\d+)\.?\s+)?(?P<description>.*?[A-Za-z].*?)\s+(?P<quantity>\d[\d,]*(?:\.\d+)?)\s+(?P<unit>[A-Za-z]{1,4})"
+    rf"\s+(?P<unit_price>{NUMBER})(?:\s+(?P<tax>{NUMBER}))?\s+(?P<rcv>{NUMBER})\s+(?P<depreciation>{NUMBER})\s+(?P<acv>{NUMBER})$"
+)
+NUMBER_PATTERN = re.compile(rf"^{NUMBER}$")
+# Column headings of an estimate table, matched against header cells
+HEADER_CELLS = [
+    ("quantity", re.compile(r"^(?:qty|quantity)\b", re.IGNORECASE)),
+    ("unit_price", re.compile(r"^(?:unit\s+)?(?:price|cost)\b", re.IGNORECASE)),
+    ("tax", re.compile(r"^tax\b", re.IGNORECASE)),
+    ("rcv", re.compile(r"^(?:rcv|replacement)\b", re.IGNORECASE)),
+    ("depreciation", re.compile(r"^(?:deprec\.?|depreciation)", re.IGNORECASE)),
+    ("acv", re.compile(r"^(?:acv|actual)\b", re.IGNORECASE)),
+]
+# Subtotal and summary rows repeat figures that are already counted in their lines
+SUBTOTAL_ROW = re.compile(r"^(?:sub)?totals?\b|^summary\b|^line\s+item\s+total", re.IGNORECASE)
+# "Estimate detail page 3 - Kitchen" -> "Kitchen"
+ROOM_SUFFIX = re.compile(r"\s+-\s+(?P<room>[^-]+)$")
+
+
+def _mult(m, n):
+    return [
+        m[0] * n[0] + m[1] * n[2],
+        m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2],
+        m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4],
+        m[4] * n[1] + m[5] * n[3] + n[5],
+    ]
+
+
+def _decode(raw, encoding, mapping):
+    """Shown string -> text, decoded the way PyPDF2's extract_text decodes it"""
+    if isinstance(raw, str):
+        return raw
+    if isinstance(encoding, str):
+        try:
+            text = raw.decode(encoding, "surrogatepass")
+        except Exception:
+            text = raw.decode("utf-16-be" if encoding == "charmap" else "charmap", "surrogatepass")
+    else:
+        text = "".join(encoding[b] if b in encoding else bytes((b,)).decode("latin-1") for b in raw)
+    return "".join(mapping.get(c, c) for c in text)
+
+
+def page_fragments(page):
+    """Every string shown on a page with its start position
+
+    PyPDF2's text visitor reports the text matrix of the operator that
+    flushed a run rather than the one that placed it, so the content stream
+    is walked here and each Tj/TJ gets the position it was drawn at.
+    """
+    if build_char_map is None:
+        return text_fragments(page)
+    try:
+        resources = page["/Resources"]
+        fonts = resources["/Font"] if "/Font" in resources else {}
+        content = page.get_contents()
+    except Exception:
+        return []
+    if content is None:
+        return []
+    if not isinstance(content, ContentStream):
+        content = ContentStream(content, page.pdf)
+    char_maps = {name: build_char_map(name, 200.0, page) for name in fonts}
+
+    fragments = []
+    cm = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+    cm_stack = []
+    tm = line = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+    leading = 0.0
+    font_size = 12.0
+    encoding, mapping = "charmap", {}
+    for operands, operator in content.operations:
+        if operator == b"BT":
+            tm = line = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+        elif operator == b"q":
+            cm_stack.append(cm)
+        elif operator == b"Q":
+            cm = cm_stack.pop() if cm_stack else [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+        elif operator == b"cm":
+            cm = _mult([float(v) for v in operands], cm)
+        elif operator == b"Tf":
+            char_map = char_maps.get(operands[0])
+            encoding, mapping = (char_map[2], char_map[3]) if char_map else ("charmap", {})
+            font_size = float(operands[1])
+        elif operator == b"TL":
+            leading = float(operands[0])
+        elif operator == b"Tm":
+            tm = line = [float(v) for v in operands]
+        elif operator in (b"Td", b"TD"):
+            if operator == b"TD":
+                leading = -float(operands[1])
+            tm = line = _mult([1.0, 0.0, 0.0, 1.0, float(operands[0]), float(operands[1])], line)
+        elif operator in (b"T*", b"'", b'"'):
+            tm = line = _mult([1.0, 0.0, 0.0, 1.0, 0.0, -leading], line)
+        if operator in (b"Tj", b"'", b'"', b"TJ"):
+            if operator == b"TJ":
+                text = "".join(_decode(op, encoding, mapping) for op in operands[0] if isinstance(op, (str, bytes)))
+            else:
+                text = _decode(operands[-1], encoding, mapping)
+            if text.strip():
+                m = _mult(tm, cm)
+                scale = font_size * abs(m[0]) or font_size
+                fragments.append(Fragment(m[4], m[5], m[4] + len(text) * scale * GLYPH_WIDTH, text.strip()))
+            # Strings on one line follow each other; the next Tj starts roughly where this one ended
+            tm = list(tm)
+            tm[4] += len(text) * font_size * GLYPH_WIDTH
+    return fragments
+
+
+def text_fragments(page):
+    """One fragment per extracted text line, for PyPDF2 versions whose font decoding is not available
+
+    Positions are made up, so every row is parsed by ROW_PATTERN.
+    """
+    try:
+        lines = [line.strip() for line in (page.extract_text() or "").splitlines()]
+    except Exception:
+        return []
+    return [Fragment(0.0, -row * ROW_TOLERANCE * 4, 0.0, line) for row, line in enumerate(lines) if line]
+
+
+def group_rows(fragments):
+    """Fragments -> rows top to bottom, each a list of cells left to right
+
+    Fragments that touch (a word split across operators) are joined into one cell.
+    """
+    rows = []
+    for fragment in sorted(fragments, key=lambda f: (-f.y, f.x)):
+        if rows and abs(rows[-1][0].y - fragment.y) <= ROW_TOLERANCE:
+            rows[-1].append(fragment)
+        else:
+            rows.append([fragment])
+    cells_by_row = []
+    for row in rows:
+        cells = []
+        for fragment in sorted(row, key=lambda f: f.x):
+            if cells and fragment.x - cells[-1].end < GLYPH_WIDTH * 4:
+                last = cells[-1]
+                cells[-1] = Fragment(last.x, last.y, fragment.end, last.text + " " + fragment.text)
+            else:
+                cells.append(fragment)
+        cells_by_row.append(cells)
+    return cells_by_row
+
+
+def _header_columns(cells):
+    """{column: x} when the row is a table heading, else None"""
+    columns = {}
+    for cell in cells:
+        for column, pattern in HEADER_CELLS:
+            if column not in columns and pattern.match(cell.text):
+                columns[column] = cell.x
+                break
+    if "rcv" in columns and "acv" in columns:
+        return columns
+    return None
+
+
+def _item_from_cells(cells, columns):
+    """LineItem fields from a row laid out under a detected heading, or None"""
+    numeric = [cell for cell in cells if NUMBER_PATTERN.match(cell.text.split(" ")[0])]
+    if not numeric:
+        return None
+    first_column = min(columns.values())
+    description = " ".join(cell.text for cell in cells if cell.end <= first_column + GLYPH_WIDTH * 4)
+    if not re.search(r"[A-Za-z]", description):
+        return None
+    values = {"unit": ""}
+    for cell in cells:
+        if cell.x < first_column - GLYPH_WIDTH * 4:
+            continue
+        value, _, unit = cell.text.partition(" ")
+        if not NUMBER_PATTERN.match(value):
+            continue
+        # Numbers are usually right aligned under their heading, so take the nearest heading by either edge
+        column = min(columns, key=lambda c: min(abs(columns[c] - cell.x), abs(columns[c] - cell.end)))
+        values[column] = claim_extractor.parse_amount(value)
+        if column == "quantity" and unit:
+            values["unit"] = unit
+    # Subtotal rows carry money columns but no quantity
+    if "rcv" not in values or "acv" not in values or "quantity" not in values:
+        return None
+    number, _, rest = description.partition(" ")
+    if number.rstrip(".").isdigit() and rest:
+        values["number"], description = int(number.rstrip(".")), rest
+    values["description"] = description
+    return values
+
+
+def _item_from_text(text):
+    match = ROW_PATTERN.match(text)
+    if match is None:
+        return None
+    values = {column: claim_extractor.parse_amount(match.group(column)) for column in ("quantity",) + MONEY_COLUMNS}
+    values.update(number=int(match.group("number")) if match.group("number") else None,
+                  description=match.group("description"), unit=match.group("unit"))
+    return values
+
+
+def iter_line_items(pages):
+    """Yield a LineItem per estimate row across pages of fragment lists
+
+    Rows under a detected column heading are split by x position; rows that
+    were drawn as one string fall back to the column order of an estimate.
+    A text-only row that is not an item names the room for the rows below it.
+    """
+    columns = None
+    room = ""
+    for page_num, fragments in enumerate(pages, start=1):
+        for cells in group_rows(fragments):
+            text = " ".join(cell.text for cell in cells)
+            heading = _header_columns(cells)
+            if heading is not None:
+                columns = heading
+                continue
+            values = _item_from_cells(cells, columns) if columns and len(cells) > 1 else None
+            if values is None:
+                values = _item_from_text(text)
+            if values is not None and SUBTOTAL_ROW.match(values["description"]):
+                continue
+            if values is None:
+                if not re.search(r"\d[\d,]*\.\d{2}", text) and len(text) <= 60:
+                    suffix = ROOM_SUFFIX.search(text)
+                    room = suffix.group("room").strip() if suffix else text.strip()
+                continue
+            yield LineItem(values.get("number"), values["description"], room, page_num, values.get("quantity"),
+                           values.get("unit", ""), values.get("unit_price"), values["rcv"],
+                           values.get("depreciation"), values["acv"])
+
+
+def _cents(amount):
+    return int(amount * 100) if amount is not None else 0
+
+
+class LineItemTable:
+    """Estimate line items as columns for vectorized totals and rankings
+
+    Money is stored as int64 cents so sums are exact; rooms are category
+    codes into self.rooms. Descriptions stay a plain list and are only read
+    for the rows a question asks about.
+    """
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.rooms = list(dict.fromkeys(item.room for item in self.items))
+        room_codes = {room: code for code, room in enumerate(self.rooms)}
+        self.room = np.fromiter((room_codes[item.room] for item in self.items), np.int32, len(self.items))
+        self.page = np.fromiter((item.page for item in self.items), np.int32, len(self.items))
+        self.quantity = np.fromiter((float(item.quantity or 0) for item in self.items), np.float64, len(self.items))
+        for column in MONEY_COLUMNS:
+            setattr(self, column, np.fromiter((_cents(getattr(item, column)) for item in self.items), np.int64,
+                                              len(self.items)))
+
+    def __len__(self):
+        return len(self.items)
+
+    @classmethod
+    def concat(cls, named_tables):
+        """One table from (document name, table) pairs; rooms are prefixed with their document"""
+        return cls(item._replace(room=f"{name}: {item.room}" if item.room else name)
+                   for name, table in named_tables for item in table.items)
+
+    def total(self, column):
+        if column == "quantity":
+            return Decimal(repr(float(self.quantity.sum())))
+        return Decimal(int(getattr(self, column).sum())).scaleb(-2)
+
+    def sums_by_room(self, column):
+        """{room: total} in first-seen room order"""
+        values = getattr(self, column)
+        sums = np.bincount(self.room, weights=values, minlength=len(self.rooms))
+        if column == "quantity":
+            return {room: Decimal(repr(float(total))) for room, total in zip(self.rooms, sums)}
+        return {room: Decimal(int(round(total))).scaleb(-2) for room, total in zip(self.rooms, sums)}
+
+    def ranked(self, column, count=1, largest=True):
+        """LineItems with the largest (or smallest) values in column"""
+        values = getattr(self, column)
+        if not len(values):
+            return []
+        order = np.argsort(-values if largest else values, kind="stable")[:count]
+        return [self.items[i] for i in order]
+
+
+# Wording that marks a question about individual lines rather than the claim totals: "line items",
+# "line 12", "which line/room", "per room", "by category". A bare "line" or "area" is too common
+# ("bottom line", "roof area", "reply in three lines") to count.
+TABLE_QUESTION = re.compile(
+    r"\bline[\s-]+items?\b|\bline\s+#?\d+\b|\bwhich\s+(?:lines?|rooms?|areas?|categor(?:y|ies))\b"
+    r"|\b(?:per|by|each|every)\s+(?:lines?|rooms?|areas?|categor(?:y|ies))\b",
+    re.IGNORECASE,
+)
+ITEM_WORDS = re.compile(r"\bitems?\b", re.IGNORECASE)
+COLUMN_WORDS = [
+    ("depreciation", re.compile(r"\bdeprec", re.IGNORECASE)),
+    ("acv", re.compile(r"\b(?:acv|actual\s+cash)", re.IGNORECASE)),
+    ("rcv", re.compile(r"\b(?:rcv|replacement\s+cost)", re.IGNORECASE)),
+    ("unit_price", re.compile(r"\b(?:unit\s+price|price)", re.IGNORECASE)),
+    ("quantity", re.compile(r"\b(?:quantity|qty)", re.IGNORECASE)),
+]
+LARGEST_WORDS = re.compile(r"\b(?:most|largest|highest|biggest|greatest|max(?:imum)?|top|costliest)\b", re.IGNORECASE)
+SMALLEST_WORDS = re.compile(r"\b(?:least|smallest|lowest|min(?:imum)?|cheapest)\b", re.IGNORECASE)
+TOP_ROWS = 3
+
+
+def asks_about_line_items(question):
+    """True for questions about line items, rooms or categories, or that rank items ("what item costs most")"""
+    if TABLE_QUESTION.search(question):
+        return True
+    return bool(ITEM_WORDS.search(question) and (LARGEST_WORDS.search(question) or SMALLEST_WORDS.search(question)))
+
+
+def _money(amount):
+    return f"${amount:,.2f}"
+
+
+def _describe(item, column):
+    value = getattr(item, column)
+    shown = f"{value}" if column == "quantity" else _money(value or 0)
+    number = f"line {item.number}: " if item.number is not None else ""
+    room = f"{item.room}, " if item.room else ""
+    return f"{number}{item.description} ({room}page {item.page}) - {COLUMN_LABELS[column]} {shown}"
+
+
+def question_facts(table, question):
+    """Figures computed from the line-item table for a question about lines, rooms or categories
+
+    Returns "" when the question is not about line items or the table is
+    empty, so ordinary questions keep their prompt unchanged.
+    """
+    if table is None or not len(table) or not asks_about_line_items(question):
+        return ""
+    columns = [column for column, pattern in COLUMN_WORDS if pattern.search(question)] or ["rcv", "depreciation", "acv"]
+    lines = [f"{len(table)} line items across {len(table.rooms)} rooms/categories."]
+    for column in columns:
+        label = COLUMN_LABELS[column]
+        total = table.total(column)
+        lines.append(f"Sum of {label} over all line items: {total if column == 'quantity' else _money(total)}")
+        if len(table.rooms) > 1:
+            by_room = table.sums_by_room(column)
+            shown = ", ".join(f"{room or 'Unlabelled'} {value if column == 'quantity' else _money(value)}"
+                              for room, value in by_room.items())
+            lines.append(f"{label[0].upper() + label[1:]} by room/category: {shown}")
+        for largest, pattern, wording in ((True, LARGEST_WORDS, "most"), (False, SMALLEST_WORDS, "least")):
+            if pattern.search(question) or (largest and not SMALLEST_WORDS.search(question)):
+                ranked = table.ranked(column, TOP_ROWS, largest)
+                lines.append(f"Line items with the {wording} {label}:")
+                lines.extend(f"  {rank}. {_describe(item, column)}" for rank, item in enumerate(ranked, start=1))
+    return "\n".join(lines)
+
+
+def extract_table(data):
+    """LineItemTable for the estimate rows of a PDF"""
+    with tracing.span("line_items", bytes=len(data)) as span:
+        reader = PyPDF2.PdfReader(io.BytesIO(data))
+        table = LineItemTable(iter_line_items(page_fragments(page) for page in reader.pages))
+        span.set(pages=len(reader.pages), items=len(table), rooms=len(table.rooms))
+    return table
+
+
+_tables = OrderedDict()
+_tables_lock = threading.Lock()
+
+
+def get_table(doc_hash, build):
+    """LineItemTable for a document, built on first use by build() and kept per content hash"""
+    with _tables_lock:
+        table = _tables.get(doc_hash)
+        if table is not None:
+            _tables.move_to_end(doc_hash)
+            return table
+    table = build()
+    print(f"[SUCCESS] Line items: {len(table)} rows across {len(table.rooms)} rooms")
+    with _tables_lock:
+        _tables[doc_hash] = table
+        while len(_tables) > LINE_ITEM_CACHE_MAX:
+            _tables.popitem(last=False)
+    return table
@@ -0,0 +1,323 @@
+"""Load test: simulated users driving streamlit_app.py through Streamlit's AppTest
+
+    python load_test.py --sessions 20 --concurrency 5 --output load.json
+    MOCK_LATENCY=1.5 MOCK_ERROR_RATE=0.05 python load_test.py --sessions 50 --concurrency 10 --unique
+
+Each session renders the app, uploads a claim (which indexes it and fills
+the extraction cards), asks questions through the Ask Expert form and
+clicks a quick question, the way a user would. Model calls go to the mock
+backend (MODEL_BACKEND=mock, tuned with the MOCK_* settings), so an
+instance's limits can be found offline without spending quota. The report
+has sessions and questions per second, p50/p95/p99 per step, errors, model
+calls and resident memory per session.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+os.environ.setdefault("MODEL_BACKEND", "mock")
+
+import streamlit as st
+from streamlit.proto.Common_pb2 import FileURLs
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.secrets import Secrets
+from streamlit.runtime.uploaded_file_manager import UploadedFile, UploadedFileRec
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import app_test
+
+import benchmark
+import model_registry
+
+APP_PATH = "streamlit_app.py"
+# Session state key the simulated uploader reads, so every session uploads its own files
+UPLOADS_KEY = "_load_test_uploads"
+QUESTIONS = [
+    "What is my ACV?",
+    "And how much of that is recoverable?",
+    "Which line has the most depreciation?",
+    "What is my deductible and when is it applied?",
+]
+ERROR_MARKERS = ("Error generating", "❌")
+
+# AppTest's session_state setter warns about a missing ScriptRunContext when used between runs
+logging.getLogger("streamlit.runtime.scriptrunner.script_run_context").setLevel(logging.ERROR)
+
+
+def simulated_uploader(label, *args, accept_multiple_files=False, **kwargs):
+    """Stand-in for st.file_uploader: AppTest cannot set uploads, so each session's files come from session state"""
+    files = [
+        UploadedFile(UploadedFileRec(f"{name}-{len(data)}", name, "application/pdf", data), FileURLs())
+        for name, data in st.session_state.get(UPLOADS_KEY, [])
+    ]
+    if accept_multiple_files:
+        return files
+    return files[0] if files else None
+
+
+def shared_runtime(secrets):
+    """Patches that let AppTests run concurrently, like sessions of one server
+
+    AppTest installs a mock Runtime singleton (and st.secrets, when given
+    secrets) for each run and restores them afterwards, which breaks any
+    other session still running. Here every session sees one runtime, with
+    media files and st.cache_data storage shared as on a real server, and
+    one set of secrets; AppTest sets and clears a subclass instead.
+    """
+    runtime = mock.MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    shared_secrets = Secrets([])
+    shared_secrets._secrets = dict(secrets)
+    return [
+        mock.patch.object(app_test, "Runtime", type("LoadTestRuntime", (Runtime,), {})),
+        mock.patch.object(Runtime, "_instance", runtime),
+        mock.patch.object(st, "secrets", shared_secrets),
+    ]
+
+
+def current_rss_mb():
+    """Resident memory now (Linux); falls back to the peak where /proc is missing"""
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError):
+        return benchmark.peak_rss_mb()
+
+
+def percentiles(timings):
+    if not timings:
+        return {"count": 0}
+    timings = sorted(timings)
+
+    def pick(share):
+        return round(timings[min(len(timings) - 1, int(round(share * (len(timings) - 1))))] * 1000, 1)
+
+    return {
+        "count": len(timings),
+        "p50_ms": pick(0.5),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(timings[-1] * 1000, 1),
+        "mean_ms": round(statistics.fmean(timings) * 1000, 1),
+    }
+
+
+def page_errors(at):
+    """Exceptions, st.error messages and failed answers on the rendered page"""
+    errors = [str(getattr(e, "value", e)) for e in at.exception]
+    errors.extend(e.value for e in at.error)
+    errors.extend(m.value for m in at.markdown if "expert-answer" in m.value and any(
+        marker in m.value for marker in ERROR_MARKERS))
+    return errors
+
+
+class Session:
+    """One simulated user; steps records (step, seconds, errors) as the session goes"""
+
+    def __init__(self, number, uploads, questions, quick_questions, timeout):
+        self.number = number
+        self.uploads = uploads
+        self.questions = questions
+        self.quick_questions = quick_questions
+        self.timeout = timeout
+        self.steps = []
+        self.at = None
+
+    def _step(self, name, action):
+        started = time.perf_counter()
+        try:
+            action()
+            errors = page_errors(self.at)
+        except Exception as e:
+            errors = [f"{type(e).__name__}: {str(e)}"]
+        self.steps.append((name, time.perf_counter() - started, errors))
+        return not errors
+
+    def run(self):
+        self.at = AppTest.from_file(APP_PATH, default_timeout=self.timeout)
+        if not self._step("render", self.at.run):
+            return self
+
+        def upload():
+            self.at.session_state[UPLOADS_KEY] = self.uploads
+            self.at.run()
+
+        if not self._step("upload", upload):
+            return self
+        for question in self.questions:
+            def ask(question=question):
+                self.at.text_input[0].input(question)
+                next(b for b in self.at.button if "Ask" in str(b.label)).click()
+                self.at.run()
+            self._step("question", ask)
+        for index in range(self.quick_questions):
+            def quick(index=index):
+                self.at.button(key=f"quick_{index}").click()
+                self.at.run()
+            self._step("quick_question", quick)
+        return self
+
+
+def run(sessions=10, concurrency=4, pages=30, pdf_path=None, unique=False, questions=None, quick_questions=1,
+        warmup=1, timeout=120):
+    """Run the simulated sessions and return the report dict"""
+    if pdf_path:
+        with open(pdf_path, "rb") as file:
+            shared_pdf = (os.path.basename(pdf_path), file.read())
+    else:
+        shared_pdf = ("claim.pdf", benchmark.synthetic_claim_pdf(pages))
+
+    def uploads_for(number):
+        if unique and not pdf_path:
+            return [(f"claim-{number}.pdf", benchmark.synthetic_claim_pdf(pages, number))]
+        return [shared_pdf]
+
+    questions = QUESTIONS if questions is None else questions
+    config = model_registry.load_model_config()
+    report = {
+        "meta": {
+            "commit": benchmark.git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "backend": config.backend,
+            "sessions": sessions,
+            "concurrency": concurrency,
+            "pages": None if pdf_path else pages,
+            "pdf": pdf_path,
+            "unique_documents": unique,
+            "questions_per_session": len(questions) + quick_questions,
+            "mock": {name: os.environ.get(name) for name in (
+                "MOCK_LATENCY", "MOCK_TOKEN_LATENCY", "MOCK_ERROR_RATE", "MOCK_ANSWER_WORDS") if name in os.environ},
+        },
+    }
+
+    with contextlib.ExitStack() as patches:
+        secrets = {"MODEL_BACKEND": config.backend}
+        if os.environ.get("GEMINI_API"):
+            secrets["GEMINI_API"] = os.environ["GEMINI_API"]
+        for patch in [mock.patch.object(st, "file_uploader", simulated_uploader)] + shared_runtime(secrets):
+            patches.enter_context(patch)
+        # Loads the glossary, tokenizer and imports once, so they do not count against the sessions
+        for number in range(warmup):
+            print(f"[DEBUG] Warm-up session {number + 1}")
+            Session(-1 - number, uploads_for(-1 - number), questions[:1], 0, timeout).run()
+        rss_before = current_rss_mb()
+        model = _local_model(config)
+        calls_before = len(model.calls) if model else 0
+        injected_before = model.injected_errors if model else 0
+
+        print(f"[DEBUG] Running {sessions} sessions, {concurrency} at a time")
+        started = time.perf_counter()
+        peak = {"rss_mb": rss_before}
+        stop = threading.Event()
+
+        def sample_memory():
+            while not stop.wait(0.5):
+                peak["rss_mb"] = max(peak["rss_mb"] or 0, current_rss_mb() or 0)
+
+        sampler = threading.Thread(target=sample_memory, daemon=True)
+        sampler.start()
+        with ThreadPoolExecutor(concurrency, thread_name_prefix="session") as pool:
+            finished = list(pool.map(
+                lambda number: Session(number, uploads_for(number), questions, quick_questions, timeout).run(),
+                range(sessions)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        sampler.join()
+        # Sessions are still referenced here, so their state counts towards resident memory
+        rss_after = current_rss_mb()
+
+    steps = {}
+    errors = []
+    for session in finished:
+        for name, seconds, step_errors in session.steps:
+            steps.setdefault(name, []).append(seconds)
+            errors.extend({"session": session.number, "step": name, "error": error[:300]} for error in step_errors)
+    completed = sum(1 for session in finished if not any(step_errors for _, _, step_errors in session.steps))
+    answered = len(steps.get("question", [])) + len(steps.get("quick_question", []))
+    session_times = [sum(seconds for _, seconds, _ in session.steps) for session in finished]
+
+    report["throughput"] = {
+        "elapsed_s": round(elapsed, 2),
+        "sessions_per_s": round(sessions / elapsed, 3),
+        "questions_per_s": round(answered / elapsed, 3),
+        "sessions_without_errors": completed,
+    }
+    report["latency"] = {name: percentiles(timings) for name, timings in steps.items()}
+    report["latency"]["session"] = percentiles(session_times)
+    report["errors"] = {"count": len(errors), "samples": errors[:20]}
+    # Injected errors that the client retried successfully do not show up as session errors
+    report["model_calls"] = len(model.calls) - calls_before if model else None
+    report["injected_errors"] = model.injected_errors - injected_before if model else None
+    report["memory"] = {
+        "rss_before_mb": rss_before,
+        "rss_peak_mb": peak["rss_mb"],
+        "rss_after_mb": rss_after,
+        "per_session_mb": round((rss_after - rss_before) / sessions, 2) if rss_after and rss_before else None,
+    }
+    return report
+
+
+def _local_model(config):
+    """The mock model behind the app's shared client, or None for the real API"""
+    if config.backend == model_registry.DEFAULT_BACKEND:
+        return None
+    # The app uses the backend name as its key when no GEMINI_API is configured
+    model = model_registry.get_client(os.environ.get("GEMINI_API") or config.backend, config).model
+    return model if hasattr(model, "calls") else None
+
+
+def print_summary(report):
+    throughput = report["throughput"]
+    print(f"Sessions: {report['meta']['sessions']} ({report['meta']['concurrency']} concurrent) in {throughput['elapsed_s']}s"
+          f" - {throughput['sessions_per_s']} sessions/s, {throughput['questions_per_s']} questions/s")
+    for name, stats in report["latency"].items():
+        if stats["count"]:
+            print(f"{name:>15} n={stats['count']:<4} p50 {stats['p50_ms']:>9.1f}  p95 {stats['p95_ms']:>9.1f}"
+                  f"  p99 {stats['p99_ms']:>9.1f}  max {stats['max_ms']:>9.1f} ms")
+    memory = report["memory"]
+    print(f"Memory: {memory['rss_before_mb']} -> {memory['rss_after_mb']} MB resident (peak {memory['rss_peak_mb']}),"
+          f" ~{memory['per_session_mb']} MB per session")
+    print(f"Model calls: {report['model_calls']} ({report['injected_errors']} injected failures),"
+          f" errors: {report['errors']['count']},"
+          f" sessions without errors: {throughput['sessions_without_errors']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive simulated sessions through the Streamlit app")
+    parser.add_argument("--sessions", type=int, default=10, help="simulated users in total")
+    parser.add_argument("--concurrency", type=int, default=4, help="sessions running at the same time")
+    parser.add_argument("--pages", type=int, default=30, help="pages of the synthetic claim each session uploads")
+    parser.add_argument("--pdf", help="upload this PDF instead of a synthetic claim")
+    parser.add_argument("--unique", action="store_true",
+                        help="give every session its own synthetic claim instead of sharing one document")
+    parser.add_argument("--questions", type=int, default=len(QUESTIONS), help="Ask Expert questions per session")
+    parser.add_argument("--quick", type=int, default=1, help="quick-question buttons clicked per session")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed sessions run first")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed per script run")
+    parser.add_argument("--output", default="load_test_results.json", help="where to write the JSON report")
+    args = parser.parse_args(argv)
+
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.questions)]
+    report = run(args.sessions, args.concurrency, args.pages, args.pdf, args.unique, questions, args.quick,
+                 args.warmup, args.timeout)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print_summary(report)
+    print(f"[SUCCESS] Load test results written to {args.output}")
+    return 0 if report["errors"]["count"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import datetime
+import hashlib
+import os
+import threading
+from collections import namedtuple
+
+import google.generativeai as genai
+from google.generativeai import caching
+
+import fake_gemini
+import gemini_client
+import prompt_cache
+
+DEFAULT_MODEL_NAME = "gemini-2.5-flash"
+DEFAULT_BACKEND = "gemini"
+
+
+class ModelConfig(namedtuple("ModelConfig", ["model_name", "temperature", "max_output_tokens", "backend"],
+                             defaults=(DEFAULT_BACKEND,))):
+    """Model name plus generation settings; None leaves a setting at the model default
+
+    backend names an entry in BACKENDS, e.g. "mock" to run without the API.
+    """
+
+    def generation_config(self):
+        config = {}
+        if self.temperature is not None:
+            config["temperature"] = self.temperature
+        if self.max_output_tokens is not None:
+            config["max_output_tokens"] = self.max_output_tokens
+        return config or None
+
+    @property
+    def cache_tag(self):
+        """Identifies answers produced with this configuration in the answer cache"""
+        tag = f"{self.model_name}|t={self.temperature}|max={self.max_output_tokens}"
+        # Answers from a local backend must never be served as real ones
+        return tag if self.backend == DEFAULT_BACKEND else f"{tag}|backend={self.backend}"
+
+
+def _optional(value, cast):
+    if value is None or str(value).strip() == "":
+        return None
+    return cast(value)
+
+
+def load_model_config(settings=None):
+    """Build a ModelConfig from a settings mapping (e.g. st.secrets), falling back to the environment"""
+    # st.secrets raises on len() when there is no secrets file
+    settings = {} if settings is None else settings
+
+    def setting(name):
+        try:
+            value = settings.get(name)
+        except Exception:
+            value = None
+        return os.environ.get(name) if value is None else value
+
+    return ModelConfig(
+        model_name=setting("GEMINI_MODEL") or DEFAULT_MODEL_NAME,
+        temperature=_optional(setting("GEMINI_TEMPERATURE"), float),
+        max_output_tokens=_optional(setting("GEMINI_MAX_OUTPUT_TOKENS"), int),
+        backend=setting("MODEL_BACKEND") or DEFAULT_BACKEND,
+    )
+
+
+DEFAULT_CONFIG = load_model_config()
+
+_clients = {}
+_configured_key = None
+_lock = threading.Lock()
+
+
+def _key_id(api_key):
+    # Clients are keyed by a hash so the key itself is never kept as a dict key
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _cached_model_factory(config):
+    """PrefixCache (create, delete) callbacks: upload a prefix as Gemini cached content bound to a model, and delete it"""
+    uploads = {}
+    lock = threading.Lock()
+
+    def create(text, ttl):
+        cached = caching.CachedContent.create(
+            model=f"models/{config.model_name}", contents=[text], ttl=datetime.timedelta(seconds=ttl))
+        model = genai.GenerativeModel.from_cached_content(cached, generation_config=config.generation_config())
+        with lock:
+            uploads[id(model)] = cached
+        return model
+
+    def delete(model):
+        with lock:
+            cached = uploads.pop(id(model), None)
+        if cached is not None:
+            cached.delete()
+
+    return create, delete
+
+
+def _gemini_backend(api_key, config):
+    """(model, create_prefix, delete_prefix) for the Gemini API"""
+    global _configured_key
+    key_id = _key_id(api_key)
+    if _configured_key != key_id:
+        genai.configure(api_key=api_key)
+        _configured_key = key_id
+    model = genai.GenerativeModel(config.model_name, generation_config=config.generation_config())
+    return (model,) + _cached_model_factory(config)
+
+
+def _mock_backend(api_key, config):
+    """(model, create_prefix, delete_prefix) for the local mock; see the MOCK_* settings in fake_gemini"""
+    model = fake_gemini.FakeGenerativeModel.from_env(config.model_name)
+    return model, model.cache_prefix, model.delete_prefix
+
+
+# name -> factory(api_key, config) returning (model, create_prefix, delete_prefix). model needs
+# generate_content(contents, stream=..., request_options=...); create_prefix(text, ttl_seconds)
+# returns a model bound to a cached prefix, or is None when the backend cannot cache contexts;
+# delete_prefix(bound_model) removes that cached prefix, or is None.
+BACKENDS = {
+    "gemini": _gemini_backend,
+    "mock": _mock_backend,
+}
+
+
+def register_backend(name, factory):
+    """Make a backend selectable with MODEL_BACKEND=name"""
+    BACKENDS[name] = factory
+
+
+def get_client(api_key, config=None):
+    """Return the process-wide GeminiClient for this API key and model config, creating it once"""
+    config = config or DEFAULT_CONFIG
+    key_id = _key_id(api_key)
+    with _lock:
+        client = _clients.get((key_id, config))
+        if client is None:
+            backend = BACKENDS.get(config.backend)
+            if backend is None:
+                raise ValueError(f"Unknown model backend {config.backend!r}; choose one of {', '.join(BACKENDS)}")
+            model, create_prefix, delete_prefix = backend(api_key, config)
+            prefix_cache = None
+            if prompt_cache.PROMPT_CACHE_ENABLED and create_prefix is not None:
+                prefix_cache = prompt_cache.PrefixCache(create_prefix, delete=delete_prefix)
+            client = gemini_client.GeminiClient(model, prefix_cache=prefix_cache)
+            _clients[(key_id, config)] = client
+            print(f"[SUCCESS] Model client ready: models/{config.model_name} ({config.backend})")
+        return client
+
+
+def install_client(api_key, client, config=None):
+    """Register a ready-made client for this key and config, e.g. one wrapping fake_gemini for dry runs"""
+    config = config or DEFAULT_CONFIG
+    key_id = _key_id(api_key)
+    with _lock:
+        _clients[(key_id, config)] = client
+
+
+def clear():
+    """Drop cached clients (e.g. after rotating the API key)"""
+    global _configured_key
+    with _lock:
+        _clients.clear()
+        _configured_key = None
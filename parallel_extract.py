@@ -0,0 +1,144 @@
+import atexit
+import io
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import PyPDF2
+
+# Below this many pages the pool start-up and IPC cost more than they save
+PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "100"))
+DEFAULT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", "0")) or (os.cpu_count() or 1)
+# Several shards per worker keep the pool balanced and let pages stream back in order
+SHARDS_PER_WORKER = 4
+# spawn is the safe choice inside a threaded server like Streamlit
+START_METHOD = os.environ.get("PDF_EXTRACT_START_METHOD", "spawn")
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _open_reader(source):
+    """Worker side: open the PDF from a path or an attached shared-memory block"""
+    kind, value = source
+    if kind == "path":
+        with open(value, "rb") as file:
+            return PyPDF2.PdfReader(io.BytesIO(file.read()))
+    name, size = value
+    # Workers share the parent's resource tracker, so the parent's unlink is the only cleanup needed
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+    return PyPDF2.PdfReader(io.BytesIO(data))
+
+
+def _extract_range(source, start, stop):
+    reader = _open_reader(source)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _get_pool(workers):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            context = multiprocessing.get_context(START_METHOD)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _iter_serial(reader):
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def iter_page_texts(pdf_source, workers=None, min_pages=None):
+    """Yield raw page texts in page order, sharding large PDFs across a process pool
+
+    pdf_source is a file path or the PDF bytes. Bytes are handed to workers
+    through one shared-memory block instead of being pickled per shard.
+    """
+    workers = workers or DEFAULT_WORKERS
+    min_pages = PARALLEL_MIN_PAGES if min_pages is None else min_pages
+
+    if isinstance(pdf_source, (str, os.PathLike)):
+        with open(pdf_source, "rb") as file:
+            data = file.read()
+        source = ("path", os.fspath(pdf_source))
+    else:
+        data = bytes(pdf_source)
+        source = None
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    page_count = len(reader.pages)
+
+    if workers <= 1 or page_count < min_pages:
+        yield from _iter_serial(reader)
+        return
+
+    shm = None
+    futures = []
+    try:
+        if source is None:
+            shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+            shm.buf[:len(data)] = data
+            source = ("shm", (shm.name, len(data)))
+        shard = max(1, math.ceil(page_count / (workers * SHARDS_PER_WORKER)))
+        pool = _get_pool(workers)
+        for start in range(0, page_count, shard):
+            futures.append(pool.submit(_extract_range, source, start, min(start + shard, page_count)))
+    except (OSError, RuntimeError) as e:
+        print(f"[DEBUG] Parallel extraction unavailable, extracting serially: {str(e)}")
+        for future in futures:
+            future.cancel()
+        futures = []
+
+    try:
+        if not futures:
+            yield from _iter_serial(reader)
+            return
+        print(f"[DEBUG] Extracting {page_count} pages with {workers} workers in {len(futures)} shards")
+        yielded = 0
+        try:
+            for future in futures:
+                for text in future.result():
+                    yielded += 1
+                    yield text
+        except BrokenProcessPool as e:
+            # A worker died: finish the remaining pages in this process
+            print(f"[DEBUG] Extraction pool failed after {yielded} pages, continuing serially: {str(e)}")
+            shutdown_pool()
+            for i in range(yielded, page_count):
+                yield reader.pages[i].extract_text() or ""
+    finally:
+        # Also reached when the consumer stops early: drop shards nobody will read
+        for future in futures:
+            future.cancel()
+        if shm is not None:
+            for future in futures:
+                if not future.cancelled():
+                    try:
+                        future.exception()
+                    except Exception:
+                        pass
+            shm.close()
+            shm.unlink()
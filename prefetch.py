@@ -0,0 +1,88 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import tracing
+
+# Set PREFETCH=0 to only call the model for questions that are actually asked
+PREFETCH_ENABLED = os.environ.get("PREFETCH", "1") != "0"
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", "4"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Thread pool shared by every session; model calls still go through the client's in-flight limit"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        return _executor
+
+
+class Prefetch:
+    """Answers to predictable questions computed in the background into the answer cache
+
+    jobs is a list of (rag, question) pairs. The questions for one rag chain
+    go to the model together through its invoke_many, but each question has
+    its own future, so a click can wait for the one it needs. take() on a
+    question whose batch has not started drops only that question, and
+    cancel() drops every question not yet started. A model call already in
+    flight cannot be interrupted and still lands in the cache.
+    """
+
+    def __init__(self, jobs, executor=None):
+        self.cancelled = threading.Event()
+        # (pdf_hash, question) -> Future of its answer, fulfilled by its chain's batch
+        self._futures = {}
+        executor = executor or get_executor()
+        batches = {}
+        for rag, question in jobs:
+            key = (rag.pdf_hash, question)
+            if key not in self._futures:
+                self._futures[key] = Future()
+                batches.setdefault(rag, []).append((question, self._futures[key]))
+        for rag, batch in batches.items():
+            executor.submit(self._run, rag, batch)
+
+    def _run(self, rag, batch):
+        # Questions taken or cancelled while the batch was queued are left out
+        batch = [(question, future) for question, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        with tracing.span("prefetch", questions=len(batch)) as span:
+            try:
+                results = rag.invoke_many([{"input": question} for question, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                raise
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            span.set(answer_cache_hits=sum(1 for result in results if result.get("cached")),
+                     errors=sum(1 for result in results if result.get("error")))
+
+    def take(self, rag, question, timeout=None):
+        """Wait for a running prefetch of this question so the caller never pays for it twice
+
+        A question whose batch has not started is dropped from it instead and
+        the caller answers it itself. Returns the prefetched result or None.
+        """
+        future = self._futures.pop((rag.pdf_hash, question), None)
+        if future is None or future.cancel():
+            return None
+        try:
+            return future.result(timeout)
+        except Exception as e:
+            print(f"[DEBUG] Prefetch failed: {str(e)}")
+            return None
+
+    def cancel(self):
+        self.cancelled.set()
+        cancelled = sum(1 for future in self._futures.values() if future.cancel())
+        if cancelled:
+            print(f"[DEBUG] Cancelled {cancelled} prefetched questions")
+
+    def pending(self):
+        return sum(1 for future in self._futures.values() if not future.done())
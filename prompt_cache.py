@@ -0,0 +1,170 @@
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import token_count
+
+# Set PROMPT_CACHE=1 to upload each claim whole as a cached context. Questions then carry the
+# whole document instead of their retrieved chunks, so it is off unless asked for
+PROMPT_CACHE_ENABLED = os.environ.get("PROMPT_CACHE", "0") == "1"
+PROMPT_CACHE_TTL = int(os.environ.get("PROMPT_CACHE_TTL", "3600"))
+# Gemini refuses to cache shorter contents; larger documents keep per-question retrieval
+PROMPT_CACHE_MIN_TOKENS = int(os.environ.get("PROMPT_CACHE_MIN_TOKENS", "1024"))
+PROMPT_CACHE_MAX_TOKENS = int(os.environ.get("PROMPT_CACHE_MAX_TOKENS", "200000"))
+PROMPT_CACHE_WORKERS = 2
+# A prefix is re-registered this many seconds before it expires, so no request races the expiry
+EXPIRY_MARGIN = 60
+
+# The part of a prompt that is the same for every question about a document
+PromptPrefix = namedtuple("PromptPrefix", ["text", "key", "tokens"])
+
+
+def static_prefix(text, min_tokens=PROMPT_CACHE_MIN_TOKENS, max_tokens=PROMPT_CACHE_MAX_TOKENS):
+    """PromptPrefix for text, or None when it is too short or too long to be worth caching"""
+    # Even dense text averages more than one character per token; skip counting huge documents
+    if len(text) > max_tokens * 8:
+        return None
+    tokens = token_count.count_tokens(text)
+    if not min_tokens <= tokens <= max_tokens:
+        return None
+    return PromptPrefix(text, hashlib.sha256(text.encode("utf-8")).hexdigest(), tokens)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Threads that upload and delete prefixes, so neither blocks building a chain or releasing it"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(PROMPT_CACHE_WORKERS, thread_name_prefix="prompt-cache")
+        return _executor
+
+
+class _Upload:
+    """One upload of a prefix; expires is set when it finishes"""
+    __slots__ = ("future", "expires", "previous")
+
+    def __init__(self, previous=None):
+        self.future = None
+        self.expires = None
+        # The upload this one renews, still usable until it really expires
+        self.previous = previous
+
+
+class PrefixCache:
+    """Prompt prefixes uploaded to the backend in the background and kept while a chain holds them
+
+    create(text, ttl_seconds) uploads a prefix and returns a model bound to
+    it; delete(model) removes an upload. register() holds a prefix and
+    starts its upload, release() drops the hold and the last one deletes it.
+    model_for() never waits by default: while an upload is in flight, and
+    for the TTL after the backend refused one, it returns None and callers
+    use retrieval prompts. A held prefix is uploaded again shortly before
+    it expires.
+    """
+
+    def __init__(self, create, ttl=PROMPT_CACHE_TTL, delete=None, executor=None):
+        self._create = create
+        self._delete = delete
+        self.ttl = ttl
+        self._executor = executor
+        self._uploads = {}
+        self._holders = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.hits = 0
+        self.failures = 0
+        self.deleted = 0
+
+    def _upload(self, prefix):
+        """Start a new upload of prefix, or return the current one; called with the lock held"""
+        upload = self._uploads.get(prefix.key)
+        if upload is not None and (upload.expires is None or upload.expires - EXPIRY_MARGIN > time.monotonic()):
+            return upload
+        upload = _Upload(upload)
+        upload.future = (self._executor or get_executor()).submit(self._run_create, prefix, upload)
+        self._uploads[prefix.key] = upload
+        return upload
+
+    def _run_create(self, prefix, upload):
+        try:
+            model = self._create(prefix.text, self.ttl)
+            print(f"[SUCCESS] Cached prompt prefix: {prefix.tokens} tokens for {self.ttl}s")
+        except Exception as e:
+            print(f"[DEBUG] Prompt prefix caching failed, using retrieval prompts: {str(e)}")
+            model = None
+        with self._lock:
+            upload.expires = time.monotonic() + self.ttl
+            upload.previous = None
+            if model is None:
+                self.failures += 1
+            else:
+                self.created += 1
+        return model
+
+    def register(self, prefix):
+        """Hold prefix and start uploading it in the background"""
+        with self._lock:
+            self._holders[prefix.key] = self._holders.get(prefix.key, 0) + 1
+            self._upload(prefix)
+
+    def release(self, prefix):
+        """Drop a hold on prefix; the last one deletes its upload from the backend"""
+        with self._lock:
+            holders = self._holders.get(prefix.key, 0) - 1
+            if holders > 0:
+                self._holders[prefix.key] = holders
+                return
+            self._holders.pop(prefix.key, None)
+            upload = self._uploads.pop(prefix.key, None)
+        while upload is not None:
+            # Deleted once the upload finishes, on the upload threads
+            upload.future.add_done_callback(self._delete_upload)
+            upload = upload.previous
+
+    def _delete_upload(self, future):
+        model = None if future.cancelled() or future.exception() else future.result()
+        if model is None or self._delete is None:
+            return
+        try:
+            self._delete(model)
+            with self._lock:
+                self.deleted += 1
+            print("[DEBUG] Deleted cached prompt prefix")
+        except Exception as e:
+            # It still expires on the backend at the end of its TTL
+            print(f"[DEBUG] Could not delete cached prompt prefix: {str(e)}")
+
+    def model_for(self, prefix, timeout=0):
+        """Model bound to the cached prefix, or None while it uploads, after a refusal or when nobody holds it
+
+        timeout waits that many seconds for an upload in flight.
+        """
+        with self._lock:
+            if prefix.key not in self._holders:
+                return None
+            upload = self._upload(prefix)
+            previous = upload.previous
+        try:
+            model = upload.future.result(timeout)
+        except FutureTimeout:
+            # A renewal in flight: the upload it replaces is good until it really expires
+            model = None
+            if previous is not None and previous.future.done() and previous.expires > time.monotonic():
+                model = previous.future.result()
+        if model is not None:
+            with self._lock:
+                self.hits += 1
+        return model
+
+    def stats(self):
+        with self._lock:
+            return {"prefixes": len(self._uploads), "held": sum(self._holders.values()), "created": self.created,
+                    "hits": self.hits, "failures": self.failures, "deleted": self.deleted}
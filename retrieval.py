@@ -0,0 +1,185 @@
+import math
+import re
+from array import array
+from collections import Counter, namedtuple
+
+# A chunk remembers which document and page it came from so answers can point back to it
+Chunk = namedtuple("Chunk", ["page", "text", "doc"], defaults=(None,))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+
+# Claim documents spell the same figure several ways ("ACV", "Actual Cash Value")
+QUERY_EXPANSIONS = {
+    "acv": ["actual", "cash", "value"],
+    "rcv": ["replacement", "cost", "value"],
+    "depreciation": ["depr", "recoverable"],
+    "deductible": ["ded"],
+    "o&p": ["overhead", "profit"],
+}
+
+
+def tokenize(text):
+    """Lowercase word/number tokens used for both indexing and queries"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def chunk_page(page_num, page_text, chunk_chars=1200, overlap=200, doc=None):
+    """Split one cleaned page into overlapping chunks; doc labels them with their document"""
+    chunks = []
+    start = 0
+    while start < len(page_text):
+        end = min(start + chunk_chars, len(page_text))
+        # Prefer to break on a space so words are not cut in half
+        if end < len(page_text):
+            space = page_text.rfind(" ", start + chunk_chars // 2, end)
+            if space != -1:
+                end = space
+        chunks.append(Chunk(page_num, page_text[start:end].strip(), doc))
+        if end >= len(page_text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def chunk_pages(pages, chunk_chars=1200, overlap=200, doc=None):
+    """Split cleaned page texts into overlapping chunks that never cross a page"""
+    chunks = []
+    for page_num, page_text in enumerate(pages, start=1):
+        chunks.extend(chunk_page(page_num, page_text, chunk_chars, overlap, doc))
+    return chunks
+
+
+class BM25Index:
+    """In-memory Okapi BM25 index over document chunks
+
+    Term counts are kept as an inverted index of compact arrays, term ->
+    (chunk numbers, counts), so scoring only touches chunks that contain a
+    query term. A finished index is never modified, so sessions can share it.
+    """
+
+    def __init__(self, chunks=(), k1=1.5, b=0.75):
+        self.chunks = []
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = array("I")
+        self._idf = None
+        self.add(chunks)
+
+    def add(self, chunks):
+        """Index more chunks, e.g. each page as soon as it has been extracted"""
+        for chunk in chunks:
+            number = len(self.chunks)
+            tf = Counter(tokenize(chunk.text))
+            self.chunks.append(chunk)
+            self.lengths.append(sum(tf.values()))
+            for term, freq in tf.items():
+                posting = self.postings.get(term)
+                if posting is None:
+                    posting = self.postings[term] = (array("I"), array("I"))
+                posting[0].append(number)
+                posting[1].append(freq)
+        # Collection statistics are recomputed lazily on the next search
+        self._idf = None
+
+    @classmethod
+    def merge(cls, indexes):
+        """One index over several documents, reusing their term counts instead of re-tokenizing"""
+        indexes = list(indexes)
+        merged = cls(k1=indexes[0].k1, b=indexes[0].b) if indexes else cls()
+        for index in indexes:
+            offset = len(merged.chunks)
+            merged.chunks.extend(index.chunks)
+            merged.lengths.extend(index.lengths)
+            for term, (numbers, freqs) in index.postings.items():
+                posting = merged.postings.get(term)
+                if posting is None:
+                    posting = merged.postings[term] = (array("I"), array("I"))
+                posting[0].extend(numbers if not offset else array("I", (n + offset for n in numbers)))
+                posting[1].extend(freqs)
+        return merged
+
+    def relabel(self, doc):
+        """The same index with every chunk labelled doc; term counts are shared, not copied"""
+        relabeled = type(self)(k1=self.k1, b=self.b)
+        relabeled.chunks = [chunk._replace(doc=doc) for chunk in self.chunks]
+        relabeled.postings = self.postings
+        relabeled.lengths = self.lengths
+        return relabeled
+
+    def _refresh(self):
+        n = len(self.chunks)
+        avg_length = (sum(self.lengths) / n) if n else 0.0
+        idf = {
+            term: math.log(1 + (n - len(numbers) + 0.5) / (len(numbers) + 0.5))
+            for term, (numbers, _) in self.postings.items()
+        }
+        # Per-chunk length normalisation, the only part of the BM25 denominator that does not depend on the term
+        norms = [self.k1 * (1 - self.b + self.b * length / avg_length) for length in self.lengths] \
+            if avg_length else []
+        # Shared indexes are searched from several sessions at once: _idf is what marks the statistics
+        # ready, so it is published only after the rest
+        self.avg_length = avg_length
+        self._norms = norms
+        self._idf = idf
+
+    @property
+    def idf(self):
+        if self._idf is None:
+            self._refresh()
+        return self._idf
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def _query_terms(self, query):
+        terms = tokenize(query)
+        lowered = query.lower()
+        for key, extra in QUERY_EXPANSIONS.items():
+            if key in terms or key in lowered.split():
+                terms.extend(extra)
+        return terms
+
+    def score(self, query):
+        """Return the BM25 score of every chunk for the query"""
+        idf = self.idf
+        terms = [t for t in self._query_terms(query) if t in idf]
+        scores = [0.0] * len(self.chunks)
+        if not terms or not self.avg_length:
+            return scores
+        norms = self._norms
+        for term in terms:
+            weight = idf[term] * (self.k1 + 1)
+            numbers, freqs = self.postings[term]
+            for i, freq in zip(numbers, freqs):
+                scores[i] += weight * freq / (freq + norms[i])
+        return scores
+
+    def search(self, query, top_k=5):
+        """Return the top_k chunks for the query, best first"""
+        scores = self.score(query)
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        hits = [(scores[i], self.chunks[i]) for i in ranked[:top_k] if scores[i] > 0]
+        if not hits:
+            # Nothing matched: fall back to the start of the document
+            hits = [(0.0, chunk) for chunk in self.chunks[:top_k]]
+        return hits
+
+
+def source_label(chunk):
+    """Citation marker for a chunk: [Page N], or [doc, Page N] when it is labelled with a document"""
+    if chunk.doc:
+        return f"[{chunk.doc}, Page {chunk.page}]"
+    return f"[Page {chunk.page}]"
+
+
+def format_chunks(hits):
+    """Render retrieved chunks in document order with source markers"""
+    ordered = sorted((chunk for _, chunk in hits), key=lambda c: (c.doc or "", c.page))
+    return "\n\n".join(f"{source_label(chunk)} {chunk.text}" for chunk in ordered)
+
+
+def format_pages(pages, doc=None):
+    """Render whole pages with source markers, e.g. for a cached prompt prefix"""
+    return "\n\n".join(f"{source_label(Chunk(page_num, text, doc))} {text}"
+                       for page_num, text in enumerate(pages, start=1) if text)
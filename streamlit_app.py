@@ -1,11 +1,22 @@
 import streamlit as st
 from streamlit import session_state as ss
+from streamlit import runtime
 import functions
+import answer_cache
+import chat_session
+import claim_extractor
+import document_store
+import model_registry
+import prefetch
+import text_cache
+import text_normalize
+import tracing
 from token_count import TokenCount
-import re
 import base64
 import os
 import gc
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Page config MUST be first
 st.set_page_config(
@@ -15,60 +26,42 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Model name, generation settings and backend (GEMINI_MODEL, GEMINI_TEMPERATURE, GEMINI_MAX_OUTPUT_TOKENS,
+# MODEL_BACKEND) come from secrets or the environment; clients are shared across sessions
+model_config = model_registry.load_model_config(st.secrets)
+
 # Get API key
 try:
     api_key_gemini = st.secrets["GEMINI_API"]
 except (KeyError, FileNotFoundError):
-    st.error("🚨 GEMINI_API key not found in secrets.")
-    st.info("Please add GEMINI_API in app settings → Secrets")
-    st.stop()
+    if model_config.backend == model_registry.DEFAULT_BACKEND:
+        st.error("🚨 GEMINI_API key not found in secrets.")
+        st.info("Please add GEMINI_API in app settings → Secrets")
+        st.stop()
+    # Local backends (e.g. MODEL_BACKEND=mock for load tests) need no key
+    api_key_gemini = model_config.backend
 
 # INSURANCE GLOSSARY INTEGRATION
+GLOSSARY_PATH = "insurance_glossary.pdf"
+
+# Once per server process, in the background: the page renders while the compiled glossary
+# is memory-mapped (or rebuilt from the PDF when its hash changed)
 @st.cache_resource
 def load_insurance_glossary():
-    """Load and cache insurance glossary PDF"""
-    
-    # Show current working directory for debugging
-    current_dir = os.getcwd()
-    st.write(f"🔍 **Debug Info**: Current working directory: `{current_dir}`")
-    
-    # List all files in current directory
+    loader = ThreadPoolExecutor(1, thread_name_prefix="glossary")
+    future = loader.submit(functions.load_glossary_index, GLOSSARY_PATH)
+    loader.shutdown(wait=False)
+    return future
+
+def glossary_result(future):
     try:
-        files_in_dir = os.listdir(current_dir)
-        st.write(f"📁 **Files in current directory**: {files_in_dir}")
+        return future.result()
     except Exception as e:
-        st.error(f"Error listing directory: {e}")
-    
-    # Check for glossary file
-    glossary_path = "insurance_glossary.pdf"
-    
-    if not os.path.exists(glossary_path):
-        st.error("❌ **No glossary PDF found!**")
-        st.write("**Expected filename**: `insurance_glossary.pdf`")
-        return None
-    
-    file_size = os.path.getsize(glossary_path)
-    st.success(f"✅ **Found**: `{glossary_path}` (Size: {file_size} bytes)")
-    
-    try:
-        # Process glossary
-        glossary_text = functions.extract_glossary_text(glossary_path)
-        
-        if glossary_text:
-            st.success(f"✅ **Glossary processed successfully** - {len(glossary_text)} characters extracted")
-            st.write(f"📄 **Sample glossary content**: {glossary_text[:200]}...")
-            return glossary_text
-        else:
-            st.warning("⚠️ **Failed to extract glossary text**")
-            return None
-            
-    except Exception as e:
-        st.error(f"❌ **Error processing glossary**: {str(e)}")
+        print(f"[ERROR] Glossary loading failed: {str(e)}")
         return None
 
-# Load insurance glossary
-st.markdown("## 🔧 System Initialization")
-glossary_text = load_insurance_glossary()
+glossary_future = load_insurance_glossary()
+glossary_index = glossary_result(glossary_future) if glossary_future.done() else None
 
 # Enhanced CSS
 st.markdown("""
@@ -133,88 +126,297 @@ st.markdown("---")
 st.markdown("<h1 class='main-header'>📄 Insurance Claims AI Assistant</h1>", unsafe_allow_html=True)
 
 # Show expert system status
-if glossary_text:
+if glossary_index:
     st.markdown(f"""
     <div class="expert-indicator">
-        🧠 **Expert System Active** - AI will combine your claim document with comprehensive insurance terminology definitions ({len(glossary_text)} characters loaded)
+        🧠 **Expert System Active** - AI will combine your claim document with comprehensive insurance terminology definitions ({len(glossary_index)} terms loaded)
     </div>
     """, unsafe_allow_html=True)
+elif not glossary_future.done():
+    st.caption("📚 Loading insurance glossary...")
 
 # Initialize session state
 if 'rag_chain' not in ss:
     ss.rag_chain = None
 if 'auto_extraction_results' not in ss:
     ss.auto_extraction_results = None
-if 'pdf_data' not in ss:
-    ss.pdf_data = None
+if 'rag_selection' not in ss:
+    ss.rag_selection = None
+# Session document store: every upload is indexed once and kept until evicted or removed.
+# The indexed documents themselves are shared with other sessions that open the same PDF.
+if 'doc_store' not in ss:
+    ss.doc_store = document_store.DocumentStore(registry=document_store.get_registry())
+if 'doc_files' not in ss:
+    ss.doc_files = {}
+if 'uploader_key' not in ss:
+    ss.uploader_key = 0
+# Background answers for the cards and quick questions of the current selection
+if 'prefetch' not in ss:
+    ss.prefetch = None
+# Conversation behind the Ask Expert form: recent turns plus a digest of older ones
+if 'chat' not in ss:
+    ss.chat = chat_session.ChatSession()
+
+# Predictable questions, answered in the background as soon as a claim is indexed
+EXTRACTION_QUESTION = """Please extract and explain the following information from this insurance claim:
+
+1. RCV (Replacement Cost Value) - What is the RCV amount and what does RCV mean?
+2. ACV (Actual Cash Value) - What is the ACV amount and what does ACV mean?  
+3. Depreciation - What is the depreciation amount withheld and what does depreciation mean in insurance terms?
+
+For each item, provide both the specific amount from the document AND a clear explanation of what the term means."""
+
+QUICK_QUESTIONS = [
+    ("What's my ACV?", "What is my ACV amount and what does ACV mean in insurance terms?"),
+    ("What's my RCV?", "What is my RCV amount and what does RCV mean in insurance terms?"),
+    ("How much depreciation?", "What is the depreciation amount and what does depreciation mean in insurance?"),
+    ("What's my deductible?", "What is my deductible amount and what does deductible mean in insurance?"),
+]
 
 # Memory cleanup
 def cleanup_memory():
     gc.collect()
 
+# Encoded once per document; reruns reuse the cached payload
+@st.cache_resource(max_entries=4)
+def encode_pdf_data_uri(pdf_hash, _pdf_data):
+    return "data:application/pdf;base64," + base64.b64encode(_pdf_data).decode('utf-8')
+
+def pdf_viewer_src(pdf_hash, pdf_data):
+    """URL for the PDF viewer: a content-addressed media URL, or a cached data URI without a server"""
+    try:
+        if runtime.exists():
+            # Same bytes -> same /media/<id>.pdf URL, so the browser downloads the file once
+            url = runtime.get_instance().media_file_mgr.add(pdf_data, "application/pdf", "pdf_viewer")
+            base_path = st.get_option("server.baseUrlPath").strip("/")
+            return f"/{base_path}{url}" if base_path else url
+    except Exception as e:
+        print(f"[DEBUG] Media endpoint unavailable, using data URI: {str(e)}")
+    return encode_pdf_data_uri(pdf_hash, pdf_data)
+
+# Build extraction cards from locally extracted amounts, explained with glossary definitions
+EXTRACTION_CARDS = [
+    ("💰 RCV", "rcv", "RCV", "#e3f2fd"),
+    ("💵 ACV", "acv", "ACV", "#f3e5f5"),
+    ("📉 Depreciation", "depreciation", "Depreciation", "#fff3e0"),
+]
+
+def build_extraction_cards(amounts):
+    cards = []
+    for label, field, term, bg_color in EXTRACTION_CARDS:
+        found = amounts.get(field)
+        if found is None:
+            text = "Not found in document - try asking below"
+        else:
+            text = f"{claim_extractor.format_amount(found.amount)} (page {found.page}: \"{found.text}\")"
+            if glossary_index:
+                terms = glossary_index.find_terms(term)
+                if terms:
+                    text += f"<br>{glossary_index.entries[terms[0]][0]}"
+        cards.append((label, text, bg_color))
+    return cards
+
+# Render a streamed answer into a single answer box as pieces arrive
+def render_answer_stream(stream, title=None):
+    heading = f"<strong>{title}</strong><br><br>" if title else ""
+    placeholder = st.empty()
+    placeholder.markdown(f'<div class="expert-answer">{heading}⏳ Analyzing your question...</div>', unsafe_allow_html=True)
+    pieces = []
+    for piece in stream:
+        pieces.append(piece)
+        placeholder.markdown(f"""
+        <div class="expert-answer">
+            {heading}{''.join(pieces)}
+        </div>
+        """, unsafe_allow_html=True)
+    if stream.cached:
+        st.caption("⚡ Cached answer - served instantly without a new AI call")
+
 # Check file size function
 def check_file_size(uploaded_file):
     if uploaded_file is not None:
-        file_size_mb = len(uploaded_file.getbuffer()) / (1024 * 1024)
+        file_size_mb = uploaded_file.size / (1024 * 1024)
         if file_size_mb > 5:
-            st.error(f"🚨 File too large: {file_size_mb:.1f}MB. Maximum allowed: 5MB")
+            st.error(f"🚨 {uploaded_file.name} is too large: {file_size_mb:.1f}MB. Maximum allowed: 5MB")
             return False
         else:
-            st.success(f"✅ File size: {file_size_mb:.1f}MB")
+            st.success(f"✅ {uploaded_file.name}: {file_size_mb:.1f}MB")
             return True
     return False
 
+# Index new uploads into the session store and forget documents whose upload was removed
+def sync_documents(uploaded_files):
+    current = {f.file_id for f in uploaded_files}
+    for file_id in list(ss.doc_files):
+        if file_id not in current:
+            doc_hash = ss.doc_files.pop(file_id)
+            if doc_hash not in ss.doc_files.values():
+                ss.doc_store.remove(doc_hash)
+    
+    for uploaded_file in uploaded_files:
+        if uploaded_file.file_id in ss.doc_files:
+            continue
+        with st.spinner(f"Indexing {uploaded_file.name}..."), tracing.span("upload", file=uploaded_file.name, bytes=uploaded_file.size):
+            # One immutable buffer shared by the extractor and the viewer; no temp file
+            document = functions.index_document(uploaded_file.getvalue(), uploaded_file.name, ss.doc_store.registry)
+        ss.doc_files[uploaded_file.file_id] = document.doc_hash
+        for evicted in ss.doc_store.add(document):
+            st.warning(f"♻️ {evicted.name} was unloaded to stay within the session memory limit - re-upload it to search it again")
+    
+    ss.doc_store.registry.collect()
+    
+    # Upload order, one entry per distinct document still in the store
+    ordered = []
+    for uploaded_file in uploaded_files:
+        doc_hash = ss.doc_files[uploaded_file.file_id]
+        if doc_hash in ss.doc_store and doc_hash not in ordered:
+            ordered.append(doc_hash)
+    return ordered
+
+# Optional timing breakdown of recent requests across all sessions (ADMIN_PANEL=1 in secrets or the environment)
+def admin_panel_enabled():
+    try:
+        value = st.secrets.get("ADMIN_PANEL", os.environ.get("ADMIN_PANEL", ""))
+    except FileNotFoundError:
+        value = os.environ.get("ADMIN_PANEL", "")
+    return str(value).lower() in ("1", "true", "yes")
+
+def render_admin_panel():
+    with st.sidebar:
+        st.markdown("### ⏱️ Recent Requests")
+        traces = tracing.recent_traces()
+        if traces:
+            labels = [f"{time.strftime('%H:%M:%S', time.localtime(t.start_ns / 1e9))} {t.name} · {t.duration_ms:.0f} ms"
+                      for t in traces]
+            picked = st.selectbox("Request", labels, key="admin_trace")
+            st.dataframe(tracing.breakdown(traces[labels.index(picked)]), hide_index=True, use_container_width=True)
+        else:
+            st.caption("No requests traced yet")
+        
+        registry = document_store.get_registry()
+        st.markdown("### 📚 Shared Documents")
+        st.caption(f"~{registry.resident_bytes / (1024 * 1024):.1f}MB resident across all sessions")
+        st.dataframe(registry.report(), hide_index=True, use_container_width=True)
+        
+        st.markdown("### 🗄️ Caches")
+        caches = {"PDF text": text_cache.get_text_cache().stats(), "Answers": answer_cache.get_answer_cache().stats()}
+        st.dataframe([{"cache": name, "hits": stats["hits"], "misses": stats["misses"],
+                       "hit_rate": f"{stats['hit_rate']:.0%}", "entries": stats["entries"]}
+                      for name, stats in caches.items()], hide_index=True, use_container_width=True)
+
+# Question-answering chain over the given documents (expert mode when the glossary is loaded)
+def build_rag_chain(documents):
+    if glossary_index:
+        return functions.create_expert_claim_system(documents, glossary_index, api_key_gemini, model_config)
+    return functions.process_pdf_from_file(documents, api_key_gemini, model_config)
+
+# Answer the model-backed cards and the quick questions before anyone clicks
+def start_prefetch(selected):
+    cancel_prefetch()
+    if not prefetch.PREFETCH_ENABLED:
+        return
+    jobs = []
+    for doc in ss.doc_store.select(selected):
+        # Cards only need the model when the local extractor found nothing
+        if not any(field in doc.amounts for field in claim_extractor.PRIMARY_FIELDS):
+            card_chain = ss.rag_chain if len(selected) == 1 else build_rag_chain([doc])
+            jobs.append((card_chain, EXTRACTION_QUESTION))
+    jobs.extend((ss.rag_chain, question) for _, question in QUICK_QUESTIONS)
+    ss.prefetch = prefetch.Prefetch(jobs)
+
+# Stop background answers nobody will see, so they do not use up quota
+def cancel_prefetch():
+    if ss.prefetch is not None:
+        ss.prefetch.cancel()
+        ss.prefetch = None
+
+# Let the backend drop the cached prompt prefix of a chain that is being replaced
+def close_rag_chain():
+    if ss.rag_chain is not None:
+        ss.rag_chain.close()
+        ss.rag_chain = None
+
+def reset_documents():
+    cancel_prefetch()
+    close_rag_chain()
+    ss.doc_store.clear()
+    ss.doc_files = {}
+    ss.rag_selection = None
+    ss.auto_extraction_results = None
+    ss.chat.reset()
+
 # File uploader
-uploaded_file = st.file_uploader("📁 Upload Your Insurance Claim Document (Max: 5MB)", type=['pdf'], key='pdf_upload')
+uploaded_files = st.file_uploader("📁 Upload Your Insurance Claim Documents - e.g. estimate, supplement, policy declarations (Max: 5MB each)",
+                                  type=['pdf'], accept_multiple_files=True, key=f'pdf_upload_{ss.uploader_key}')
+uploaded_files = [f for f in uploaded_files or [] if check_file_size(f)]
 
-if uploaded_file is not None and check_file_size(uploaded_file):
+if uploaded_files:
+    # Answers need the glossary; it has normally finished loading while the file was picked
+    glossary_index = glossary_result(glossary_future)
+    try:
+        doc_hashes = sync_documents(uploaded_files)
+    except Exception as e:
+        st.error(f"❌ Error: {str(e)}")
+        st.stop()
+    # Widgets show file names; identical names are told apart by their hash
+    doc_labels = {}
+    for doc in ss.doc_store.select(doc_hashes):
+        label = doc.name if doc.name not in doc_labels else f"{doc.name} ({doc.doc_hash[:8]})"
+        doc_labels[label] = doc.doc_hash
+    
+    # Search across any subset of the session's documents
+    if len(doc_hashes) > 1:
+        selected_labels = st.multiselect("🔎 Documents to search", list(doc_labels), default=list(doc_labels), key="doc_selection")
+        selected = [doc_labels[label] for label in selected_labels]
+        st.caption(f"📚 {len(ss.doc_store)} documents indexed · ~{ss.doc_store.resident_bytes / (1024 * 1024):.1f}MB in memory")
+    else:
+        selected = doc_hashes
+    
+    if not selected:
+        st.info("Select at least one document to search")
+        st.stop()
+    
     # Layout
     container_pdf, container_chat = st.columns([0.45, 0.55], gap='small')
     
     with container_pdf:
         # Process PDF with Expert System
-        if ss.rag_chain is None:
+        if ss.rag_chain is None or ss.rag_selection != tuple(selected):
             with st.spinner("Creating expert insurance system from your claim..."):
                 try:
-                    # Save and process file
-                    with open("temp.pdf", "wb") as f:
-                        f.write(uploaded_file.getbuffer())
-            
-                    # Create expert system
-                    if glossary_text:
-                        ss.rag_chain = functions.create_expert_claim_system(
-                            "temp.pdf", 
-                            glossary_text, 
-                            api_key_gemini
-                        )
+                    close_rag_chain()
+                    with tracing.span("build_system", documents=len(selected)):
+                        ss.rag_chain = build_rag_chain(ss.doc_store.select(selected))
+                    ss.rag_selection = tuple(selected)
+                    start_prefetch(selected)
+                    if glossary_index:
                         success_msg = "✅ Expert insurance system created! AI can now provide detailed explanations."
                     else:
-                        # Fallback to original processing
-                        ss.rag_chain = functions.process_pdf_from_file("temp.pdf", api_key_gemini)
                         success_msg = "✅ Claim processed successfully! (Basic mode - no glossary)"
                     
-                    ss.pdf_data = uploaded_file.getbuffer()
-                    
-                    if os.path.exists("temp.pdf"):
-                        os.remove("temp.pdf")
-                        
                     st.success(success_msg)
                         
                 except Exception as e:
                     st.error(f"❌ Error: {str(e)}")
-                    if os.path.exists("temp.pdf"):
-                        os.remove("temp.pdf")
+                    ss.rag_chain = None
                     st.stop()
         
         st.markdown('<p class="section-title">📄 Your Claim Document</p>', unsafe_allow_html=True)
         
+        if len(selected) > 1:
+            viewed_label = st.selectbox("Showing", selected_labels, key="viewed_doc", label_visibility="collapsed")
+            viewed_hash = doc_labels[viewed_label]
+        else:
+            viewed_hash = selected[0]
+        viewed_doc = ss.doc_store.get(viewed_hash)
+        
         # PDF Viewer
-        if ss.pdf_data is not None:
+        if viewed_doc is not None:
             try:
-                base64_pdf = base64.b64encode(ss.pdf_data).decode('utf-8')
+                pdf_src = pdf_viewer_src(viewed_doc.doc_hash, viewed_doc.data)
                 st.markdown(f"""
                 <iframe 
-                    src="data:application/pdf;base64,{base64_pdf}" 
+                    src="{pdf_src}" 
                     width="100%" 
                     height="650" 
                     style="border: 1px solid #ddd; border-radius: 8px;">
@@ -224,7 +426,7 @@ if uploaded_file is not None and check_file_size(uploaded_file):
                 try:
                     st.markdown(f"""
                     <embed 
-                        src="data:application/pdf;base64,{base64_pdf}" 
+                        src="{pdf_src}" 
                         width="100%" 
                         height="650" 
                         type="application/pdf"
@@ -237,29 +439,31 @@ if uploaded_file is not None and check_file_size(uploaded_file):
         # Auto-extraction with expert explanations
         st.markdown('<p class="section-title">🔍 Expert Information Extraction</p>', unsafe_allow_html=True)
         
-        if ss.auto_extraction_results is None and ss.rag_chain is not None:
-            # Enhanced extraction question with explanations
-            extraction_question = """Please extract and explain the following information from this insurance claim:
-
-1. RCV (Replacement Cost Value) - What is the RCV amount and what does RCV mean?
-2. ACV (Actual Cash Value) - What is the ACV amount and what does ACV mean?  
-3. Depreciation - What is the depreciation amount withheld and what does depreciation mean in insurance terms?
-
-For each item, provide both the specific amount from the document AND a clear explanation of what the term means."""
-            
+        if len(selected) > 1:
+            st.caption(f"Figures from {viewed_doc.name}")
+        
+        # Cards are built once per document and kept while it stays in the store
+        if ss.auto_extraction_results is None:
+            ss.auto_extraction_results = {}
+        extraction_cards = ss.auto_extraction_results.get(viewed_hash)
+        
+        # Amounts found by the local extractor fill the cards instantly
+        if extraction_cards is None:
+            if any(field in viewed_doc.amounts for field in claim_extractor.PRIMARY_FIELDS):
+                extraction_cards = build_extraction_cards(viewed_doc.amounts)
+        
+        # Only ask the model when the local extractor found nothing
+        if extraction_cards is None:
             with st.spinner("Using expert system to extract and explain key information..."):
                 try:
-                    result = ss.rag_chain.invoke({"input": extraction_question})
+                    with tracing.span("extraction_cards", document=viewed_doc.name):
+                        card_chain = ss.rag_chain if selected == [viewed_hash] else build_rag_chain([viewed_doc])
+                        # Waits for the background answer if it is already being computed
+                        if ss.prefetch is not None:
+                            ss.prefetch.take(card_chain, EXTRACTION_QUESTION)
+                        result = card_chain.invoke({"input": EXTRACTION_QUESTION})
                     combined_answer = result['answer']
                     
-                    # Clean text
-                    def clean_text(text):
-                        text = re.sub(r'\*+', '', text)
-                        text = re.sub(r'\[\$\]', '$', text)
-                        text = re.sub(r'[#_`]', '', text)
-                        text = re.sub(r'\s+', ' ', text)
-                        return text.strip()
-                    
                     # Enhanced parsing for explanations
                     lines = combined_answer.split('\n')
                     rcv_answer = "Not found in document"
@@ -270,7 +474,7 @@ For each item, provide both the specific amount from the document AND a clear ex
                     temp_content = []
                     
                     for line in lines:
-                        clean_line = clean_text(line)
+                        clean_line = text_normalize.normalize_answer(line)
                         if not clean_line:
                             continue
                             
@@ -326,22 +530,27 @@ For each item, provide both the specific amount from the document AND a clear ex
                         elif 'depreciation' in current_section:
                             dep_answer = content
                     
-                    ss.auto_extraction_results = [
+                    extraction_cards = [
                         ("💰 RCV", rcv_answer, "#e3f2fd"),
                         ("💵 ACV", acv_answer, "#f3e5f5"),
                         ("📉 Depreciation", dep_answer, "#fff3e0")
                     ]
                     
                 except Exception as e:
-                    ss.auto_extraction_results = [
+                    extraction_cards = [
                         ("💰 RCV", "Expert extraction failed - try asking specific questions", "#e3f2fd"),
                         ("💵 ACV", "Expert extraction failed - try asking specific questions", "#f3e5f5"),
                         ("📉 Depreciation", "Expert extraction failed - try asking specific questions", "#fff3e0")
                     ]
         
+        ss.auto_extraction_results[viewed_hash] = extraction_cards
+        for old_hash in list(ss.auto_extraction_results):
+            if old_hash not in ss.doc_store:
+                del ss.auto_extraction_results[old_hash]
+        
         # Display enhanced results
-        if ss.auto_extraction_results:
-            for i, (label, answer, bg_color) in enumerate(ss.auto_extraction_results):
+        if extraction_cards:
+            for i, (label, answer, bg_color) in enumerate(extraction_cards):
                 st.markdown(f"""
                 <div class="tall-extraction-card" style="background-color: {bg_color};">
                     <div style="font-weight: bold; font-size: 1rem; color: #1565c0; margin-bottom: 0.5rem;">{label}</div>
@@ -352,106 +561,94 @@ For each item, provide both the specific amount from the document AND a clear ex
         # Q&A section with expert system
         st.markdown('<p class="section-title">💬 Ask Your Insurance Questions</p>', unsafe_allow_html=True)
         
-        if glossary_text:
+        if glossary_index:
             st.info("🧠 **Expert Mode**: Ask about any insurance terms for detailed explanations!")
         
         if ss.rag_chain is not None:
+            # Follow-up questions see the conversation about the current selection only
+            ss.chat.bind(ss.rag_chain.pdf_hash)
+            if ss.chat.turn_count:
+                with st.expander(f"🗂️ Conversation so far ({ss.chat.turn_count} questions)"):
+                    if ss.chat.digest:
+                        st.caption(f"Older questions are summarized - ~{ss.chat.history_token_count()} tokens of history go with the next question")
+                    for turn in ss.chat.turns:
+                        st.markdown(f"**You:** {turn.question}")
+                        st.markdown(turn.answer)
+                    if st.button("🆕 New conversation", key="new_conversation"):
+                        ss.chat.reset()
+                        st.rerun()
+            
             with st.form(key="question_form", clear_on_submit=True):
                 user_message = st.text_input("Question:", placeholder="e.g., What is my ACV? How much is my deductible? What does RCV mean?", label_visibility="collapsed")
                 ask_button = st.form_submit_button("🚀 Ask Expert", type="primary")
             
             if ask_button and user_message.strip():
-                with st.spinner("Expert system analyzing your question..."):
+                try:
+                    # Tokens are rendered as they arrive instead of behind a spinner
+                    st.markdown("**Expert Answer:**")
+                    with tracing.span("question", source="ask"):
+                        stream = ss.rag_chain.invoke_stream(ss.chat.request(user_message))
+                        render_answer_stream(stream)
+                    if not stream.error:
+                        ss.chat.record(user_message, stream.answer)
+                    
+                    # Show expert enhancement indicator
+                    if glossary_index:
+                        st.caption("🧠 Answer enhanced with professional insurance terminology explanations")
+                    
                     try:
-                        result = ss.rag_chain.invoke({"input": user_message})
-                        
-                        def clean_answer(text):
-                            text = re.sub(r'\*+', '', text)
-                            text = re.sub(r'[#_`]', '', text)
-                            text = re.sub(r'\s+', ' ', text)
-                            return text.strip()
-                        
-                        cleaned_answer = clean_answer(result['answer'])
-                        
-                        st.markdown("**Expert Answer:**")
-                        st.markdown(f"""
-                        <div class="expert-answer">
-                            {cleaned_answer}
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Show expert enhancement indicator
-                        if glossary_text:
-                            st.caption("🧠 Answer enhanced with professional insurance terminology explanations")
-                        
-                        try:
-                            tc = TokenCount()
-                            tokens = tc.num_tokens_from_string(str(result))
-                            st.caption(f"📊 ~{tokens} tokens")
-                        except:
-                            pass
-                        
-                    except Exception as e:
-                        st.error(f"❌ Error: {str(e)}")
+                        tc = TokenCount()
+                        tokens = tc.num_tokens_from_string(stream.answer)
+                        st.caption(f"📊 ~{tokens} tokens")
+                    except:
+                        pass
+                    
+                except Exception as e:
+                    st.error(f"❌ Error: {str(e)}")
             
             # Enhanced quick questions
             st.markdown("**Common Insurance Questions:**")
-            quick_questions = ["What's my ACV?", "What's my RCV?", "How much depreciation?", "What's my deductible?"]
-            
             quick_cols = st.columns(2)
-            for i, quick_q in enumerate(quick_questions):
+            for i, (quick_q, full_question) in enumerate(QUICK_QUESTIONS):
                 with quick_cols[i % 2]:
                     if st.button(quick_q, key=f"quick_{i}"):
-                        full_questions = [
-                            "What is my ACV amount and what does ACV mean in insurance terms?",
-                            "What is my RCV amount and what does RCV mean in insurance terms?",
-                            "What is the depreciation amount and what does depreciation mean in insurance?", 
-                            "What is my deductible amount and what does deductible mean in insurance?"
-                        ]
-                        
-                        with st.spinner("Getting expert explanation..."):
-                            try:
-                                result = ss.rag_chain.invoke({"input": full_questions[i]})
-                                
-                                def clean_answer(text):
-                                    text = re.sub(r'\*+', '', text)
-                                    text = re.sub(r'[#_`]', '', text)
-                                    text = re.sub(r'\s+', ' ', text)
-                                    return text.strip()
-                                
-                                cleaned_answer = clean_answer(result['answer'])
-                                
-                                st.markdown(f"""
-                                <div class="expert-answer">
-                                    <strong>{quick_q}</strong><br><br>
-                                    {cleaned_answer}
-                                </div>
-                                """, unsafe_allow_html=True)
-                            except Exception as e:
-                                st.error(f"❌ Error: {str(e)}")
+                        try:
+                            with tracing.span("question", source="quick"):
+                                # Prefetched answers come straight from the answer cache
+                                if ss.prefetch is not None:
+                                    with st.spinner("Finishing the answer prepared in the background..."):
+                                        ss.prefetch.take(ss.rag_chain, full_question)
+                                stream = ss.rag_chain.invoke_stream({"input": full_question})
+                                render_answer_stream(stream, quick_q)
+                            # Asked without history so prefetched answers still apply, but follow-ups can refer to it
+                            if not stream.error:
+                                ss.chat.record(full_question, stream.answer)
+                        except Exception as e:
+                            st.error(f"❌ Error: {str(e)}")
         
         # Clear memory button
         if st.button("🧹 Clear & Upload New Claim"):
+            reset_documents()
+            # A new uploader key empties the file list too
+            ss.uploader_key += 1
             cleanup_memory()
-            for key in ['rag_chain', 'auto_extraction_results', 'pdf_data']:
-                if key in ss:
-                    del ss[key]
             st.success("✅ Memory cleared!")
             st.rerun()
 
 # Reset state
-elif uploaded_file is None:
-    if ss.rag_chain is not None:
-        ss.rag_chain = None
-        ss.auto_extraction_results = None
-        ss.pdf_data = None
+else:
+    if ss.doc_files or ss.rag_chain is not None:
+        reset_documents()
         cleanup_memory()
     
     st.markdown("""
     <div style="text-align: center; padding: 1.5rem;">
-        <h3>👋 Upload Your Insurance Claim Document</h3>
+        <h3>👋 Upload Your Insurance Claim Documents</h3>
         <p>Get expert explanations of insurance terms and amounts</p>
         <p><strong>📏 Maximum file size: 5MB</strong></p>
         <p style="font-size: 0.9rem; color: #666;">🧠 The AI will explain insurance terms in simple language</p>
     </div>
     """, unsafe_allow_html=True)
+
+if admin_panel_enabled():
+    render_admin_panel()
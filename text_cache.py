@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import zlib
+
+# Bump when text cleaning changes so stale entries are never served
+CACHE_FORMAT = 2
+
+DEFAULT_CACHE_DIR = os.environ.get("PDF_TEXT_CACHE_DIR", ".pdf_text_cache")
+DEFAULT_MAX_BYTES = int(float(os.environ.get("PDF_TEXT_CACHE_MAX_MB", "200")) * 1024 * 1024)
+
+
+def content_hash(data):
+    """SHA-256 of the uploaded PDF bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class PdfTextCache:
+    """On-disk cache of per-page cleaned PDF text keyed by content hash
+
+    Entries are zlib-compressed JSON page lists. Reads refresh an entry's
+    mtime, and writes evict the least recently used files once the
+    directory grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.v{CACHE_FORMAT}.json.z")
+
+    def get(self, key):
+        """Return the cached page list for key, or None"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                pages = json.loads(zlib.decompress(file.read()).decode("utf-8"))
+            os.utime(path)
+        except (OSError, ValueError, zlib.error):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return pages
+
+    def put(self, key, pages):
+        """Store the page list for key and enforce the size bound"""
+        payload = zlib.compress(json.dumps(pages).encode("utf-8"), 6)
+        if len(payload) > self.max_bytes:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temp file first so concurrent readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                file.write(payload)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"[DEBUG] Text cache write failed: {str(e)}")
+            return
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(".json.z"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    self.evictions += 1
+                except OSError:
+                    pass
+
+    def clear(self):
+        """Remove every cached document, e.g. before a cold-start benchmark"""
+        with self._lock:
+            for _, _, path in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        """Counters for monitoring"""
+        entries = self._entries()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+            }
+
+
+_default_cache = None
+
+
+def get_text_cache():
+    """Process-wide cache shared by every session"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PdfTextCache()
+    return _default_cache
@@ -0,0 +1,88 @@
+import re
+
+# Characters PDF extractors and models emit that carry no text
+ZERO_WIDTH = "\u200b\u200c\u200d\u2060\ufeff\u00ad"
+# Unicode spaces folded to a plain space before whitespace is collapsed
+SPACES = "\xa0\u2002\u2003\u2009\u200a\u202f\u205f\u3000"
+LIGATURES = {"\ufb00": "ff", "\ufb01": "fi", "\ufb02": "fl", "\ufb03": "ffi", "\ufb04": "ffl", "\ufb05": "st", "\ufb06": "st"}
+MARKDOWN_MARKERS = "*#_`"
+
+_BASE_TABLE = {ord(c): None for c in ZERO_WIDTH}
+_BASE_TABLE.update({ord(c): " " for c in SPACES})
+_BASE_TABLE.update({ord(k): v for k, v in LIGATURES.items()})
+
+PDF_TABLE = dict(_BASE_TABLE)
+ANSWER_TABLE = dict(_BASE_TABLE)
+ANSWER_TABLE.update({ord(c): None for c in MARKDOWN_MARKERS})
+
+WHITESPACE_SPLIT = re.compile(r"(\s+)")
+# "insur-\nance" -> "insurance": a hyphen at a line end between two lowercase letters
+# (matches on the hyphen first, so the search skips ahead with a fast literal scan)
+LINE_BREAK_HYPHEN = re.compile(r"-(?<=[a-z]-)[ \t]*\r?\n\s*(?=[a-z])")
+# Models sometimes escape dollar signs as "[$]"
+ESCAPED_DOLLAR = "[$]"
+
+
+def normalize_pdf_text(text):
+    """Extracted page text -> one line: ligatures and hyphenation repaired, zero-width
+    characters dropped, every whitespace run (NBSP included) collapsed to one space"""
+    if not text.isascii():
+        text = text.translate(PDF_TABLE)
+    if "-" in text and "\n" in text:
+        text = LINE_BREAK_HYPHEN.sub("", text)
+    # str.split() splits on the same Unicode whitespace as \s, several times faster than re.sub
+    return " ".join(text.split())
+
+
+class AnswerNormalizer:
+    """Streaming normalizer for model output
+
+    feed() takes pieces as they arrive and returns the text that is safe to
+    show; flush() returns whatever was held back at the end. Markdown markers
+    and zero-width characters are dropped, "[$]" becomes "$" even when split
+    across pieces, and whitespace collapses to single spaces without a
+    leading or trailing one.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.pending_space = False
+        self._held = ""
+
+    def feed(self, text):
+        text = self._held + text.translate(ANSWER_TABLE)
+        self._held = ""
+        if "[" in text:
+            text = text.replace(ESCAPED_DOLLAR, "$")
+            # Keep a trailing "[" or "[$" until the next piece shows whether it is "[$]"
+            for partial in ("[$", "["):
+                if text.endswith(partial):
+                    text, self._held = text[:-len(partial)], partial
+                    break
+        return self._emit(text)
+
+    def flush(self):
+        held, self._held = self._held, ""
+        return self._emit(held)
+
+    def _emit(self, text):
+        out = []
+        for part in WHITESPACE_SPLIT.split(text):
+            if not part:
+                continue
+            if part.isspace():
+                # Only emit the space once more text follows, so the result is stripped
+                self.pending_space = self.started
+            else:
+                if self.pending_space:
+                    out.append(" ")
+                    self.pending_space = False
+                out.append(part)
+                self.started = True
+        return "".join(out)
+
+
+def normalize_answer(text):
+    """Whole-text form of AnswerNormalizer"""
+    normalizer = AnswerNormalizer()
+    return normalizer.feed(text) + normalizer.flush()
@@ -1,7 +1,113 @@
+import base64
+import functools
+import os
+import re
+
+# BPE vocabulary shipped with the app, so counting never needs the network
+VOCAB_PATH = os.environ.get(
+    "TOKENIZER_VOCAB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "tokenizer", "cl100k_base.tiktoken"),
+)
+CL100K_PATTERN = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s"""
+CL100K_SPECIAL_TOKENS = {
+    "<|endoftext|>": 100257,
+    "<|fim_prefix|>": 100258,
+    "<|fim_middle|>": 100259,
+    "<|fim_suffix|>": 100260,
+    "<|endofprompt|>": 100276,
+}
+
+# Used only when tiktoken or the vocabulary file is missing
+FALLBACK_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]|\s+")
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(vocab_path=VOCAB_PATH):
+    """Load the local BPE vocabulary once per process; None if unavailable"""
+    try:
+        import tiktoken
+        with open(vocab_path, "rb") as file:
+            ranks = {
+                base64.b64decode(token): int(rank)
+                for token, rank in (line.split() for line in file.read().splitlines() if line)
+            }
+        return tiktoken.Encoding(
+            name="cl100k_base",
+            pat_str=CL100K_PATTERN,
+            mergeable_ranks=ranks,
+            special_tokens=CL100K_SPECIAL_TOKENS,
+        )
+    except (ImportError, OSError, ValueError) as e:
+        print(f"[DEBUG] Tokenizer unavailable, using estimate: {str(e)}")
+        return None
+
+
+def _estimate(text):
+    tokens = 0
+    for piece in FALLBACK_PATTERN.findall(text):
+        if piece.isalpha():
+            # Long words split into several BPE pieces, roughly one per 4 letters
+            tokens += max(1, (len(piece) + 3) // 4)
+        elif not piece.isspace():
+            tokens += 1
+    return tokens
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        return _estimate(text)
+    return len(encoding.encode_ordinary(text))
+
+
+@functools.lru_cache(maxsize=8192)
+def count_static_tokens(text):
+    """Memoized count for text that is reused across prompts (template, glossary definitions, chunks)"""
+    return count_tokens(text)
+
+
 class TokenCount:
     def __init__(self, model_name="gpt-3.5-turbo"):
-        pass
-    
+        # Gemini does not publish an offline tokenizer; cl100k BPE is a close local stand-in
+        self.model_name = model_name
+        self.exact = get_encoding() is not None
+
     def num_tokens_from_string(self, text):
-        """Simple token estimation"""
-        return len(str(text)) // 4
+        """Token count using the local BPE vocabulary"""
+        return count_tokens(str(text))
+
+    def num_static_tokens(self, text):
+        return count_static_tokens(str(text))
+
+
+class TokenBudget:
+    """Greedy prompt filler: reserve fixed pieces, then take ranked items while they fit"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+
+    @property
+    def remaining(self):
+        return max(self.limit - self.used, 0)
+
+    def reserve(self, text, static=True):
+        """Charge a piece that is always sent; static pieces use the memoized count"""
+        self.used += count_static_tokens(text) if static else count_tokens(text)
+
+    def split(self, share):
+        """Carve a sub-budget of share * remaining tokens out of this one"""
+        tokens = int(self.remaining * share)
+        self.used += tokens
+        return TokenBudget(tokens)
+
+    def fill(self, items, render=str, separator="\n\n"):
+        """Return the items, in the given (ranked) order, whose rendered text fits the budget"""
+        separator_cost = count_static_tokens(separator) if separator else 0
+        taken = []
+        for item in items:
+            cost = count_static_tokens(render(item)) + (separator_cost if taken else 0)
+            if cost <= self.remaining:
+                taken.append(item)
+                self.used += cost
+        return taken
@@ -0,0 +1,242 @@
+import contextlib
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+
+# "jsonl:<path>" writes one nested JSON trace per line, "otlp:<path>" writes OTLP/JSON
+# export requests (one per line, readable by the OpenTelemetry collector's otlpjsonfile receiver)
+TRACE_EXPORT = os.environ.get("TRACE_EXPORT", "")
+TRACE_HISTORY = int(os.environ.get("TRACE_HISTORY", "50"))
+SERVICE_NAME = "pdf-chat-ai"
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed step; spans started while another is active become its children"""
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.attributes = dict(attributes or {})
+        self.children = []
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter_ns()
+        self.duration_ns = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def end(self):
+        if self.duration_ns is None:
+            self.duration_ns = time.perf_counter_ns() - self._started
+            if self.parent is None:
+                _finish(self)
+        return self
+
+    @property
+    def duration_ms(self):
+        duration = self.duration_ns if self.duration_ns is not None else time.perf_counter_ns() - self._started
+        return duration / 1e6
+
+    def walk(self, depth=0):
+        """Yield (depth, span) for this span and every descendant, depth first"""
+        yield depth, self
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+def current_span():
+    return _current.get()
+
+
+def start_span(name, **attributes):
+    """Start a span under the active one without activating it (for generators and callbacks)
+
+    The caller must call end(); a span with no parent is exported when it ends.
+    """
+    parent = _current.get()
+    span_ = Span(name, parent, attributes)
+    if parent is not None:
+        parent.children.append(span_)
+    return span_
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Time a block; spans and annotations inside it attach to this span
+
+    Do not hold one open across a yield: generators share the caller's context.
+    """
+    span_ = start_span(name, **attributes)
+    token = _current.set(span_)
+    try:
+        yield span_
+    except BaseException as e:
+        span_.set(error=f"{type(e).__name__}: {str(e)}")
+        raise
+    finally:
+        _current.reset(token)
+        span_.end()
+
+
+def annotate(**attributes):
+    """Add attributes to the active span, if any"""
+    span_ = _current.get()
+    if span_ is not None:
+        span_.set(**attributes)
+
+
+def traced_iter(name, iterable):
+    """Yield from iterable, recording one span per item for the time it took to produce
+
+    Each span attaches to whatever span is active when the consumer asks for
+    the next item, and carries the 1-based item number and its length.
+    """
+    iterator = iter(iterable)
+    number = 0
+    while True:
+        span_ = start_span(name)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            # The last call only discovers the end; do not keep a span for it
+            if span_.parent is not None:
+                span_.parent.children.remove(span_)
+            return
+        number += 1
+        span_.set(item=number, chars=len(item)).end()
+        yield item
+
+
+def breakdown(root):
+    """Flatten a trace into rows for display; repeated sibling spans (e.g. per page) are summed"""
+    rows = [{"step": root.name, "count": 1, "ms": round(root.duration_ms, 2), "details": _details(root)}]
+
+    def visit(span_, depth):
+        groups = {}
+        for child in span_.children:
+            groups.setdefault(child.name, []).append(child)
+        for name, spans in groups.items():
+            rows.append({
+                "step": "  " * depth + name,
+                "count": len(spans),
+                "ms": round(sum(child.duration_ms for child in spans), 2),
+                "details": _details(spans[0]) if len(spans) == 1 else "",
+            })
+            if len(spans) == 1:
+                visit(spans[0], depth + 1)
+
+    visit(root, 1)
+    return rows
+
+
+def _details(span_):
+    return ", ".join(f"{key}={value}" for key, value in span_.attributes.items())
+
+
+class JsonLinesExporter:
+    """Appends each finished trace as one nested JSON object per line"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, root):
+        line = json.dumps(root.to_dict(), default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpJsonExporter(JsonLinesExporter):
+    """Appends each finished trace as an OTLP/JSON ExportTraceServiceRequest line"""
+
+    def export(self, root):
+        spans = []
+        for _, span_ in root.walk():
+            record = {
+                "traceId": span_.trace_id,
+                "spanId": span_.span_id,
+                "name": span_.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span_.start_ns),
+                "endTimeUnixNano": str(span_.start_ns + int(span_.duration_ms * 1e6)),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span_.attributes.items()],
+            }
+            if span_.parent is not None:
+                record["parentSpanId"] = span_.parent.span_id
+            if span_.attributes.get("error"):
+                record["status"] = {"code": 2, "message": str(span_.attributes["error"])}
+            spans.append(record)
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}],
+        }]}
+        with self._lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(request) + "\n")
+
+
+_history = deque(maxlen=TRACE_HISTORY)
+_history_lock = threading.Lock()
+_exporters = []
+
+
+def add_exporter(exporter):
+    _exporters.append(exporter)
+
+
+def _finish(root):
+    with _history_lock:
+        _history.append(root)
+    for exporter in _exporters:
+        try:
+            exporter.export(root)
+        except Exception as e:
+            print(f"[DEBUG] Trace export failed: {str(e)}")
+
+
+def recent_traces():
+    """Finished top-level spans, most recent first"""
+    with _history_lock:
+        return list(reversed(_history))
+
+
+def _configure_from_env():
+    kind, _, path = TRACE_EXPORT.partition(":")
+    if kind == "jsonl" and path:
+        add_exporter(JsonLinesExporter(path))
+    elif kind == "otlp" and path:
+        add_exporter(OtlpJsonExporter(path))
+    elif TRACE_EXPORT:
+        print(f"[DEBUG] Ignoring TRACE_EXPORT={TRACE_EXPORT!r}; use jsonl:<path> or otlp:<path>")
+
+
+_configure_from_env()